@@ -1,6 +1,8 @@
 import argparse
+import concurrent.futures
 import csv
-from dataclasses import dataclass
+import os
+from collections.abc import Callable, Iterator
 from pathlib import Path
 
 import imufusion
@@ -8,7 +10,6 @@ import numpy as np
 from projectaria_tools.core import data_provider
 from projectaria_tools.core.data_provider import VrsDataProvider
 from projectaria_tools.core.stream_id import StreamId
-from scipy import interpolate
 
 import log
 import util
@@ -20,6 +21,39 @@ RADIAN_TO_DEGREE_FACTOR = 180 / np.pi
 EARTH_GRAVITATIONAL_ACCELERATION = 9.8067
 
 
+def affine_coefficients(
+    func: Callable[[np.ndarray], np.ndarray], dim: int = 3
+) -> tuple[np.ndarray, np.ndarray]:
+    """Recovers the matrix and offset of an affine function.
+
+    Parameters
+    ----------
+    func : callable
+        An affine function (i.e., `func(x) == matrix @ x + offset`) that takes and
+        returns vectors of length `dim`, such as the calibrations' `raw_to_rectified`
+        methods.
+    dim : int, default=3
+        The length of the vectors that `func` takes.
+
+    Returns
+    -------
+    matrix : np.ndarray
+        The `(dim, dim)` matrix of `func`.
+    offset : np.ndarray
+        The `(dim,)` offset of `func`.
+    """
+    offset = np.asarray(func(np.zeros(dim)), dtype=np.float64).reshape(dim)
+    # each column of the matrix is where func moves a basis vector (minus the offset)
+    matrix = np.column_stack(
+        [
+            np.asarray(func(basis), dtype=np.float64).reshape(dim)
+            for basis in np.eye(dim)
+        ]
+    )
+    matrix -= offset[:, np.newaxis]
+    return matrix, offset
+
+
 def run_ahrs(timestamp, accelerometer, gyroscope, magnetometer, sample_rate):
     # Instantiate algorithms
     offset = imufusion.Offset(sample_rate)
@@ -39,15 +73,23 @@ def run_ahrs(timestamp, accelerometer, gyroscope, magnetometer, sample_rate):
     # Process sensor data
     delta_time = np.diff(timestamp, prepend=timestamp[0])
     # euler = np.empty((len(timestamp), 3))
-    quaternion = np.empty((len(timestamp), 4))
+    # the quaternions are single precision in Fusion, so float32 holds them exactly
+    quaternion = np.empty((len(timestamp), 4), dtype=np.float32)
     acceleration = np.empty((len(timestamp), 3))
 
-    for i in range(len(timestamp)):
-        gyroscope[i] = offset.update(gyroscope[i])
+    # The C calls are fast, so most of each iteration is Python overhead. Bind the
+    # methods once and iterate over the rows directly instead of indexing every array
+    # 3 times per sample
+    update_offset = offset.update
+    update_ahrs = ahrs.update
+    rows = zip(gyroscope, accelerometer, magnetometer, delta_time)
+    for i, (gyro, accel, mag, dt) in enumerate(rows):
+        # gyro is a view of gyroscope's row, so this updates gyroscope too
+        gyro[:] = update_offset(gyro)
         # no need to check if magnetometer is 0 and call ahrs.update_no_magnetometer
         # if it is because update_no_magnetometer just calls update with the zero
         # vector anyway
-        ahrs.update(gyroscope[i], accelerometer[i], magnetometer[i], delta_time[i])
+        update_ahrs(gyro, accel, mag, dt)
         quaternion[i] = ahrs.quaternion.wxyz
         # euler[i] = ahrs.quaternion.to_euler()
         acceleration[i] = ahrs.earth_acceleration
@@ -55,6 +97,18 @@ def run_ahrs(timestamp, accelerometer, gyroscope, magnetometer, sample_rate):
     return quaternion, acceleration
 
 
+def _any_in_windows(a: np.ndarray, size: int) -> np.ndarray:
+    """Returns whether any of the values in each window of `a` is True.
+
+    The window at index `i` is `a[i : i + size]`. Only the windows that are entirely
+    within `a` are returned, so the result has `len(a) - size + 1` values.
+    """
+    # the number of True values in a[start:stop] is counts[stop] - counts[start]
+    counts = np.concatenate(([0], np.cumsum(a, dtype=np.int64)))
+    starts = np.arange(max(len(a) - size + 1, 0))
+    return (counts[starts + size] - counts[starts]) > 0
+
+
 # https://github.com/xioTechnologies/Gait-Tracking/blob/main/gait_tracking.py
 def calculate_position(timestamp, acceleration, sample_rate):
     delta_time = np.diff(timestamp, prepend=timestamp[0])
@@ -62,73 +116,57 @@ def calculate_position(timestamp, acceleration, sample_rate):
     log.log_vars(margin=margin)
 
     # Identify moving periods
-    is_moving = np.empty(len(timestamp))
-    for index in range(len(timestamp)):
-        # threshold = 2 m/s/s
-        is_moving[index] = np.sqrt(acceleration[index].dot(acceleration[index])) > 2
-
-    for index in range(len(timestamp) - margin):
-        # add leading margin
-        is_moving[index] = any(is_moving[index : (index + margin)])
-    for index in range(len(timestamp) - 1, margin, -1):
-        # add trailing margin
-        is_moving[index] = any(is_moving[(index - margin) : index])
+    # threshold = 2 m/s/s. Comparing the squared norm to 2**2 skips the square roots
+    is_moving = np.einsum("ij,ij->i", acceleration, acceleration) > 4
+    # add leading margin. Each sample is moving if any sample in the margin starting
+    # at it is moving (except for the last margin samples, which are left as is)
+    num_leading = max(len(is_moving) - margin, 0)
+    is_moving[:num_leading] = _any_in_windows(is_moving, margin)[:num_leading]
+    # add trailing margin. Each sample after the first margin + 1 samples is moving
+    # if any sample in the margin before (and not including) it is moving
+    is_moving[margin + 1 :] = _any_in_windows(is_moving, margin)[1:-1]
 
     # Calculate velocity (includes integral drift)
-    velocity = np.zeros((len(timestamp), 3))
-    for index in range(len(timestamp)):
-        if is_moving[index]:  # only integrate if moving
-            velocity[index] = (
-                velocity[index - 1] + delta_time[index] * acceleration[index]
-            )
-
-    # Find start and stop indices of each moving period
-    @dataclass
-    class IsMovingPeriod:
-        start_index: int = -1
-        stop_index: int = -1
+    # Only integrate if moving. The velocity is 0 whenever it isn't moving, so each
+    # velocity is the sum of the changes since the last sample that wasn't moving
+    velocity_change = delta_time[:, np.newaxis] * acceleration
+    velocity_change[~is_moving] = 0
+    velocity = np.cumsum(velocity_change, axis=0)
+    # the index of the last sample that wasn't moving at or before each sample
+    last_stopped = np.maximum.accumulate(
+        np.where(is_moving, -1, np.arange(len(timestamp)))
+    )
+    has_stopped = last_stopped >= 0
+    velocity[has_stopped] -= velocity[last_stopped[has_stopped]]
 
+    # Find start and stop indices of each moving period. A period starts on the last
+    # sample before it starts moving and stops on the last sample that's moving
+    # (viewed as int8 because np.diff can't subtract bools)
+    is_moving = is_moving.view(np.int8)
     is_moving_diff = np.diff(is_moving, append=is_moving[-1])
-    is_moving_periods = []
-    is_moving_period = IsMovingPeriod()
-
-    for index in range(len(timestamp)):
-        if is_moving_period.start_index == -1:
-            if is_moving_diff[index] == 1:
-                is_moving_period.start_index = index
-        elif is_moving_period.stop_index == -1:
-            if is_moving_diff[index] == -1:
-                is_moving_period.stop_index = index
-                is_moving_periods.append(is_moving_period)
-                is_moving_period = IsMovingPeriod()
+    start_indices = np.flatnonzero(is_moving_diff == 1)
+    stop_indices = np.flatnonzero(is_moving_diff == -1)
+    if len(start_indices) > 0:
+        # a stop before the first start is the end of a period that started before the
+        # data did, so it isn't a full period
+        stop_indices = stop_indices[stop_indices > start_indices[0]]
+    # starts and stops alternate, so each start's stop is the one at the same index.
+    # A final start without a stop is a period that hasn't stopped, so it's dropped
+    is_moving_periods = zip(start_indices, stop_indices)
 
     # Remove integral drift from velocity
     velocity_drift = np.zeros((len(timestamp), 3))
-    for is_moving_period in is_moving_periods:
-        start_index = is_moving_period.start_index
-        stop_index = is_moving_period.stop_index
-
-        t = [timestamp[start_index], timestamp[stop_index]]
-        x = [velocity[start_index, 0], velocity[stop_index, 0]]
-        y = [velocity[start_index, 1], velocity[stop_index, 1]]
-        z = [velocity[start_index, 2], velocity[stop_index, 2]]
-        t_new = timestamp[start_index : (stop_index + 1)]
-
-        velocity_drift[start_index : (stop_index + 1), 0] = interpolate.interp1d(t, x)(
-            t_new
-        )
-        velocity_drift[start_index : (stop_index + 1), 1] = interpolate.interp1d(t, y)(
-            t_new
-        )
-        velocity_drift[start_index : (stop_index + 1), 2] = interpolate.interp1d(t, z)(
-            t_new
-        )
-    velocity = velocity - velocity_drift
+    for start_index, stop_index in is_moving_periods:
+        period = slice(start_index, stop_index + 1)
+        # linearly interpolate between the velocities at the start and stop of the
+        # period. Doing it directly avoids creating 3 interp1d objects per period
+        t = timestamp[period]
+        slope = (velocity[stop_index] - velocity[start_index]) / (t[-1] - t[0])
+        velocity_drift[period] = np.outer(t - t[0], slope) + velocity[start_index]
+    velocity -= velocity_drift
 
     # Calculate position
-    position = np.zeros((len(timestamp), 3))
-    for index in range(len(timestamp)):
-        position[index] = position[index - 1] + delta_time[index] * velocity[index]
+    position = np.cumsum(delta_time[:, np.newaxis] * velocity, axis=0)
 
     return position
 
@@ -184,11 +222,12 @@ def create_poses(
 
     imu_data = data_arrays["1202-2"]
     timestamp = imu_data["capture_timestamp_ns"]
-    accelerometer = imu_data["accel_msec2"]
-    gyroscope = imu_data["gyro_radsec"]
-    for i in range(len(timestamp)):
-        accelerometer[i] = imu_calib.raw_to_rectified_accel(accelerometer[i])
-        gyroscope[i] = imu_calib.raw_to_rectified_gyro(gyroscope[i])
+    # Rectifying is affine, so rectify all of the samples at once instead of calling
+    # the calibration for every sample
+    accel_matrix, accel_offset = affine_coefficients(imu_calib.raw_to_rectified_accel)
+    gyro_matrix, gyro_offset = affine_coefficients(imu_calib.raw_to_rectified_gyro)
+    accelerometer = imu_data["accel_msec2"] @ accel_matrix.T + accel_offset
+    gyroscope = imu_data["gyro_radsec"] @ gyro_matrix.T + gyro_offset
 
     # transform_cpf_imu @ accelerometer[i] has shape (3, 1), but we need
     # (3,) so use np.squeeze to remove the extra dimension
@@ -201,32 +240,32 @@ def create_poses(
 
     mag_data = data_arrays["1203-1"]
     mag_timestamp = mag_data["capture_timestamp_ns"]
-    mag_data = mag_data["mag_tesla"]
-    mag_data[:, 0]
+    # the magnetometer calibration is affine too, so rectify all of the samples at once
+    mag_matrix, mag_offset = affine_coefficients(mag_calib.raw_to_rectified)
+    mag_data = mag_data["mag_tesla"] @ mag_matrix.T + mag_offset
+    # transform the magnetometer data from its coordinate system
+    # to the central pupil frame
+    mag_data = (transform_cpf_mag @ mag_data.T).T
     # ahrs.update ignores the magnetometer measurement if the input is the zero
     # vector, so filling zeros in between the actual measurements and passing those
     # into ahrs.update doesn't mess with the algorithm / results.
     # See https://github.com/xioTechnologies/Fusion/blob/main/Fusion/FusionAhrs.c#L208
     magnetometer = np.zeros((len(timestamp), 3))
-    for i in range(len(mag_data)):
-        mag_data[i] = mag_calib.raw_to_rectified(mag_data[i])
-        # transform the magnetometer data from its coordinate system
-        # to the central pupil frame
-        mag_data[i] = np.squeeze(transform_cpf_mag @ mag_data[i])
-        # get the index of the imu timestamp closest to the mag timestamp
-        nearest_index = util.get_nearest_index(timestamp, mag_timestamp[i])
-        magnetometer[nearest_index] = mag_data[i]
+    # get the indices of the imu timestamps closest to the mag timestamps
+    magnetometer[util.get_nearest_index(timestamp, mag_timestamp)] = mag_data
 
     # Currently, the data has +X is left, +Y is up, and +Z points forward, from the
     # person's perspective. imufusion has different conventions. We'll use the
     # ENU convention (i.e., +X is forward, +Y is left, and +Z is up) because it's
     # a right-handed coordinate system like the current one. So, we need to swap the
     # axes around to get the correct orientation.
-    # Note that we use [0, 1, 2] instead of : because otherwise there is no temporary
-    # array created, so data can be overwritten before it is moved.
-    accelerometer[:, [0, 1, 2]] = accelerometer[:, [2, 0, 1]]
-    gyroscope[:, [0, 1, 2]] = gyroscope[:, [2, 0, 1]]
-    magnetometer[:, [0, 1, 2]] = magnetometer[:, [2, 0, 1]]
+    # Fusion (the C library behind imufusion) works in single precision, so the
+    # samples are converted to float32 while they're swapped. That's the same
+    # rounding imufusion would do on every call, but it only happens once and the
+    # arrays are half the size
+    accelerometer = accelerometer[:, [2, 0, 1]].astype(np.float32)
+    gyroscope = gyroscope[:, [2, 0, 1]].astype(np.float32)
+    magnetometer = magnetometer[:, [2, 0, 1]].astype(np.float32)
 
     # convert from ns to s and make relative to the first timestamp of the vrs file
     first_timestamp = first_time_ns(dp)
@@ -266,41 +305,57 @@ def create_poses(
             # first row is the header row, add # to indicate it's a comment
             file.write("# ")
             writer.writerow(header)
-        writer.writerows(data)
-
+        # Converting to Python floats first is much faster than having csv format
+        # every NumPy float, and it writes the same text since both use the shortest
+        # repr. np.savetxt would need a fixed precision, which changes the output
+        writer.writerows(data.tolist())
 
-def route_dir(dir, scan_dir=True, **kwargs):
-    logger.debug("Running create_poses on each file in {}", dir)
-    for path in dir.iterdir():
-        route_file(path, scan_dir=scan_dir, **kwargs)
 
-
-def route_file(*paths: Path, scan_dir: bool = True, **kwargs):
-    """Handles the different types of files that can be input into this script."""
+def find_files(*paths: Path, scan_dir: bool = True) -> Iterator[Path]:
+    """Finds the VRS files in the different types of paths input into this script."""
     if len(paths) == 0:
-        paths = [
-            Path.cwd()
-        ]  # if no file or directory given, use directory script was called from
-    elif (
-        len(paths) > 1
-    ):  # if multiple files (or directories) given, run function on each one
-        for path in paths:
-            route_file(path, scan_dir=scan_dir, **kwargs)
-        # stop function because all of the processing is
-        # done in the function calls in the for loop
+        # if no file or directory given, use directory script was called from
+        paths = (Path.cwd(),)
+
+    for path in paths:
+        path = path.absolute()
+
+        if path.suffix.casefold() == ".vrs":
+            yield path
+
+        # find the files in path if it is a dir and scan_dir is True
+        elif path.is_dir() and scan_dir:
+            if path.name == "data":  # the data dir was passed so run on data/vrs
+                dir, scan_subdirs = path / "vrs", True
+            else:
+                dir, scan_subdirs = path, False
+            logger.debug("Finding VRS files in {}", dir)
+            # os.scandir caches each entry's type from the directory listing, so
+            # checking is_dir doesn't need another stat call like Path.iterdir does.
+            # Checking the extension on the entry's name also skips creating a Path
+            # for every non-VRS file
+            with os.scandir(dir) as entries:
+                for entry in entries:
+                    if os.path.splitext(entry.name)[1].casefold() == ".vrs":
+                        yield Path(entry.path)
+                    elif scan_subdirs and entry.is_dir():
+                        yield from find_files(Path(entry.path), scan_dir=True)
+
+
+def route_file(*paths: Path, scan_dir: bool = True, jobs: int = 1, **kwargs):
+    """Handles the different types of files that can be input into this script."""
+    vrs_paths = find_files(*paths, scan_dir=scan_dir)
+    if jobs == 1:
+        for path in vrs_paths:
+            create_poses(path, **kwargs)
         return
 
-    path = paths[0].absolute()  # paths[0] is--at this point--the only argument in paths
-
-    if path.suffix.casefold() == ".vrs":
-        create_poses(path, **kwargs)
-
-    # route every file in file.path if it is a dir and scan_dir is True
-    elif path.is_dir() and scan_dir:
-        if path.name == "data":  # the data dir was passed so run on data/vrs
-            route_dir(path / "vrs", scan_dir=scan_dir, **kwargs)
-        else:
-            route_dir(path, scan_dir=False, **kwargs)
+    # Each recording is processed independently and most of the time is spent in
+    # Python (the AHRS loop), so use processes instead of threads to get around the GIL
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        futures = [executor.submit(create_poses, path, **kwargs) for path in vrs_paths]
+        for future in futures:
+            future.result()  # raises the exception if create_poses failed
 
 
 def run_from_pipeline(args):
@@ -340,6 +395,16 @@ if __name__ == "__main__":
             " very accurate. Default is False."
         ),
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help=(
+            "The number of VRS files to create poses for at once. Each file is"
+            " processed in its own process. Default is 1."
+        ),
+    )
     log.add_log_level_argument(parser)
 
     args = vars(parser.parse_args())
@@ -220,13 +220,20 @@ def create_video(
     # https://web.archive.org/web/20230109224607/https://stackoverflow.com/questions/25073292/how-do-i-render-a-video-from-a-list-of-time-stamped-images)
     # -c:v libx264 sets the video codec to maintain picture quality
     # -pix_fmt yuv420p sets the pixel format to one that is widely compatible
+    video_filter = "settb=1/1000,setpts=PTS/1000"
+    if rotate:
+        # aria glasses output slam and rgb video sideways since that's how it's filmed
+        # transpose=1 rotates the video 90 degrees clockwise to correct the
+        # orientation. It's added to the same filter chain so that the video is only
+        # encoded once instead of being encoded and then re-encoded rotated
+        video_filter += ",transpose=1"
     util.ffmpeg(
         concat_path,
         video_path,
         input_options=["-f", "concat"],
         output_options=[
             "-vf",
-            "settb=1/1000,setpts=PTS/1000",
+            video_filter,
             "-c:v",
             "libx264",
             "-pix_fmt",
@@ -238,17 +245,6 @@ def create_video(
         ],
     )
 
-    if rotate:
-        rotated_video_path = output_dir / f"{stem}-rotated.mp4"
-        # aria glasses output slam and rgb video sideways since that's how it's filmed
-        # this rotates a video 90 degrees clockwise to correct the orientation
-        util.ffmpeg(
-            video_path,
-            rotated_video_path,
-            output_options=["-vf", "transpose=1"],
-        )
-        rotated_video_path.replace(video_path)  # rename rotated video
-
     if not keep_images:
         shutil.rmtree(images_dir, ignore_errors=True)
 
@@ -657,7 +653,8 @@ def extract_sensor_data(
         for stream in VIDEO_STREAMS:
             video_timestamps_path = output_dir / f"{STREAM_NAMES[stream]}-original.csv"
             if video_timestamps_path.exists():
-                video_timestamps = np.genfromtxt(video_timestamps_path)
+                # loadtxt parses in C, unlike genfromtxt
+                video_timestamps = np.loadtxt(video_timestamps_path, ndmin=1)
                 video_timestamps -= first_device_timestamp
                 video_timestamps += first_unix_timestamp
                 np.savetxt(
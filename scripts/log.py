@@ -3,10 +3,12 @@ from __future__ import annotations
 
 import functools
 import math
+import os
 import pathlib
 import subprocess
 import sys
 import time
+from collections import deque
 from typing import TYPE_CHECKING, Callable, ParamSpec, TypeVar
 
 from loguru import logger
@@ -39,6 +41,7 @@ LOG_LEVELS = [
     "ERROR",
     "CRITICAL",
 ]
+_LOG_LEVELS_SET = frozenset(LOG_LEVELS)
 TIMING_LEVEL = logger.level(
     "TIMING",
     no=13,
@@ -48,6 +51,23 @@ TIMING_LEVEL = logger.level(
 )
 
 
+# the severity number of each level, looked up once since they never change
+_LEVEL_NOS = {level: logger.level(level).no for level in LOG_LEVELS}
+
+
+def _is_logged(level: LogLevel) -> bool:
+    """Returns whether any sink will log messages at `level`."""
+    # _core.min_level is the lowest level of all of the sinks. loguru checks this too,
+    # but only after the caller has already done the work to build the message
+    return _LEVEL_NOS[level] >= logger._core.min_level  # type: ignore
+
+
+# logger.opt creates a new Logger every time it's called, so cache the ones we use
+@functools.lru_cache(maxsize=64)
+def _opt(depth: int, lazy: bool = False):
+    return logger.opt(depth=depth, lazy=lazy)
+
+
 def setup_logging(
     level: LogLevel = "WARNING",
     *,
@@ -90,10 +110,10 @@ def setup_logging(
     log_file_level = log_file_level.upper()  # type: ignore
     # can't log the invalid level messages because the logger isn't set up yet
     invalid_levels_messages = []
-    if level not in LOG_LEVELS:
+    if level not in _LOG_LEVELS_SET:
         invalid_levels_messages.append(f"Invalid log level {level}.")
         level = "WARNING"
-    if log_file_level not in LOG_LEVELS and log_file_level is not None:
+    if log_file_level not in _LOG_LEVELS_SET and log_file_level is not None:
         invalid_levels_messages.append(f"Invalid log file level {log_file_level}.")
         log_file_level = "TRACE"
 
@@ -102,13 +122,8 @@ def setup_logging(
     if log_file_level is None:
         return stderr_sink_id, None  # not logging to a file
     if calling_file is None:
-        try:
-            import __main__
-
-            calling_file = __main__.__file__
-        except (ImportError, AttributeError):
-            calling_file = "log.log"  # log file will be "log_{time}.log"
-    log_path = LOGS_DIR / f"{pathlib.Path(calling_file).stem}_{{time}}.log"
+        calling_file = _main_file()
+    log_path = _log_path_for(calling_file)
     file_sink_id = logger.add(log_path, level=log_file_level, retention=retention)
 
     for message in invalid_levels_messages:
@@ -117,6 +132,22 @@ def setup_logging(
     return stderr_sink_id, file_sink_id
 
 
+@functools.lru_cache(maxsize=1)
+def _main_file() -> str:
+    try:
+        import __main__
+
+        return __main__.__file__
+    except (ImportError, AttributeError):
+        return "log.log"  # log file will be "log_{time}.log"
+
+
+@functools.lru_cache(maxsize=8)
+def _log_path_for(calling_file: str) -> pathlib.Path:
+    # {time} is filled in by loguru when the file is created
+    return LOGS_DIR / f"{pathlib.Path(calling_file).stem}_{{time}}.log"
+
+
 # TODO: make the various log_ functions have consistent params and param names
 # arguments are suffixed with "_" so that they don't conflict with the names of
 # variables the user might want to log
@@ -147,8 +178,11 @@ def log_vars(
         The depth of the caller in the stack. This is used to determine the correct
         source file and function name to log. This usually doesn't need to be changed.
     """
+    if not _is_logged(level_):
+        return
+
     # we want lazy if we're not logging separately so that we can pass a function
-    vars_logger = logger.opt(depth=depth_ + 1, lazy=not log_separate_)
+    vars_logger = _opt(depth_ + 1, not log_separate_)
     if patcher_ is not None:
         vars_logger = vars_logger.patch(patcher_)
 
@@ -191,6 +225,21 @@ def format_seconds(seconds: float, *, prec: int = 3) -> str:
     >>> format_seconds(123.456789, prec=4)
     '00:02:03.4568'
     """
+    if not math.isfinite(seconds):
+        # NaN and infinity can't be converted to an integer number of ticks, so format
+        # them with float arithmetic instead of erroring
+        return _format_nonfinite_seconds(seconds, prec)
+    scale, format_str = _seconds_format(prec)
+    # round to an integer number of 10**-prec seconds and split that up with integer
+    # arithmetic so that rounding can carry over into the seconds (and minutes, etc.)
+    ticks = int(seconds * scale + 0.5)
+    s, frac = divmod(ticks, scale)
+    m, s = divmod(s, 60)
+    h, m = divmod(m, 60)
+    return format_str.format(h, m, s, frac)
+
+
+def _format_nonfinite_seconds(seconds: float, prec: int) -> str:
     m, s = divmod(seconds, 60)
     h, m = divmod(m, 60)
     frac_s, s = math.modf(s)  # split into fractional and integer parts
@@ -201,6 +250,14 @@ def format_seconds(seconds: float, *, prec: int = 3) -> str:
     return string
 
 
+@functools.lru_cache(maxsize=8)
+def _seconds_format(prec: int) -> tuple[int, str]:
+    if prec > 0:
+        return 10**prec, f"{{:02d}}:{{:02d}}:{{:02d}}.{{:0{prec}d}}"
+    # str.format ignores the extra argument for the fractional seconds
+    return 1, "{:02d}:{:02d}:{:02d}"
+
+
 # TODO: suffix seconds, message, and prec with _
 def log_timing(
     seconds: float,
@@ -235,7 +292,10 @@ def log_timing(
     format_seconds : Format a number of seconds as HH:MM:SS[.ffffff]
     loguru.Logger.patch : Attach a function to modify records before they are logged.
     """
-    timing_logger = logger.opt(depth=depth_ + 1)
+    if not _is_logged("TIMING"):
+        return
+
+    timing_logger = _opt(depth_ + 1)
     if patcher_ is not None:
         timing_logger = timing_logger.patch(patcher_)
     timing_logger.log(
@@ -295,6 +355,9 @@ class Timer:
     {time} | TIMING | {name}:{function}:{line} - 00:00:01.000, extra arg=xyz
     """
 
+    # bound once so that starting and stopping don't have to look up time.perf_counter
+    _perf_counter = staticmethod(time.perf_counter)
+
     # TODO: add format option for the time taken
     def __init__(self, message: str | None = None, *, prec: int = 3, log: bool = True):
         self.message = message
@@ -305,19 +368,24 @@ class Timer:
         self.start_time = float("nan")
         self.stop_time = float("nan")
         self.time_taken = float("nan")
+        # flags for whether the timer has started or stopped (cheaper than isnan checks)
+        self._started = False
+        self._stopped = False
 
     def __enter__(self):
-        self.start_time = time.perf_counter()
+        self.start_time = self._perf_counter()
+        self._started = True
         return self
 
     def __exit__(self, *args, **kwargs):
         # stop before checking start_time so that stop_time is still accurate
-        self.stop_time = time.perf_counter()
+        self.stop_time = self._perf_counter()
 
-        if math.isnan(self.start_time):
+        if not self._started:
             logger.warning("Timer was stopped before it was started.")
 
         self.time_taken = self.stop_time - self.start_time
+        self._stopped = self._started
         if self.log_on_exit:
             # depth=1 to remove __exit__ from the stack
             self.log(*args, depth_=1, **kwargs)
@@ -354,8 +422,8 @@ class Timer:
         --------
         log_timing : Log timing information.
         """
-        if math.isnan(self.time_taken):
-            if math.isnan(self.start_time):
+        if not self._stopped:
+            if not self._started:
                 logger.warning("Timer.log was called before the timer was started.")
             else:
                 logger.warning("Timer.log was called before the timer was stopped.")
@@ -381,29 +449,34 @@ class Timer:
         message = self.message
         if message is None:
             message = f"{func.__name__} took {{}}"
-        # Copy the timer so that we can set log_on_exit to False without affecting the
-        # original timer. We set log_on_exit to False because if we want to log, we
-        # need to call log manually so that we can pass in the function name patcher
-        # Copying is also beneficial because iaqt allows us to use the same timer for
-        # multiple functions without messing up the start_times
-        timer = type(self)(message, prec=self.prec, log=False)
+        prec = self.prec
+        func_name = func.__name__
+        func_module = func.__module__
+
+        # Need to patch the function name and module because loguru retrieves them
+        # from the stack frame, but @wraps doesn't change those, just the attributes
+        # Basically, this fixes loguru saying `util:wrapper:{line}` instead of
+        # the actual module and function name
+        # https://github.com/Delgan/loguru/issues/74
+        # The patcher is the same for every call, so it's only created once
+        def func_attrs_patcher(record: Record):
+            record["function"] = func_name
+            record["module"] = func_module
+            record["name"] = func_module
 
         @functools.wraps(func)
         def wrapper(*args: P.args, **kwargs: P.kwargs):
-            # Need to patch the function name and module because loguru retrieves them
-            # from the stack frame, but @wraps doesn't change those, just the attributes
-            # Basically, this fixes loguru saying `util:wrapper:{line}` instead of
-            # the actual module and function name
-            # https://github.com/Delgan/loguru/issues/74
-            def func_attrs_patcher(record: Record):
-                record["function"] = func.__name__
-                record["module"] = func.__module__
-                record["name"] = func.__module__
+            # Copy the timer so that we can set log_on_exit to False without affecting
+            # the original timer. We set log_on_exit to False because if we want to
+            # log, we need to call log manually so that we can pass in the function
+            # name patcher. Copying for each call also means that calls running at the
+            # same time (e.g., in different threads) don't mess up each other's times
+            timer = type(self)(message, prec=prec, log=False)
 
             with timer:
                 result = func(*args, **kwargs)
             if log_on_exit:
-                timer.log(_patcher=func_attrs_patcher)
+                timer.log(patcher_=func_attrs_patcher)
             return result
 
         return wrapper
@@ -427,19 +500,28 @@ def shorten_str(string: str, max_length: int = 50) -> str:
     """
     if len(string) <= max_length:
         return string
-    else:
-        return string[: max_length // 2 - 2] + "..." + string[-max_length // 2 + 1 :]
+    head, tail = _shorten_lengths(max_length)
+    return f"{string[:head]}...{string[tail:]}"
+
+
+@functools.lru_cache(maxsize=16)
+def _shorten_lengths(max_length: int) -> tuple[int, int]:
+    return max_length // 2 - 2, -max_length // 2 + 1
+
+
+_DATA_DIR_PREFIX = str(DATA_DIR) + os.sep
 
 
 def shorten_data_path(path: PathLike, max_length: int = 50) -> str:
-    path = pathlib.Path(path)
-    string = str(path)
+    string = os.fspath(path)
     if len(string) <= max_length:
         return string
     else:
-        if DATA_DIR in path.parents:
-            return "..." + str(path.relative_to(DATA_DIR))
+        # comparing strings is cheaper than building path.parents
+        if string.startswith(_DATA_DIR_PREFIX):
+            return "..." + string[len(_DATA_DIR_PREFIX) :]
         else:
+            path = pathlib.Path(path)
             parts = [str(part).casefold() for part in path.parts]
             if "data" in parts:
                 data_index = parts.index("data")
@@ -448,6 +530,13 @@ def shorten_data_path(path: PathLike, max_length: int = 50) -> str:
                 return shorten_str(string, max_length)
 
 
+# the maximum number of lines of a subprocess's output to keep
+SUBPROCESS_OUTPUT_LINES = 1000
+# the size of the buffer used to read a subprocess's output, large enough that chatty
+# commands don't need a read syscall for every few lines
+SUBPROCESS_BUFSIZE = 1 << 16
+
+
 def run_and_log_subprocess(
     args: Command,
     *,
@@ -456,8 +545,10 @@ def run_and_log_subprocess(
     _depth: int = 0,
     **kwargs,
 ) -> subprocess.CompletedProcess:
-    subprocess_logger = logger.opt(depth=_depth + 1)
-    subprocess_logger.log(_level, f"Running subprocess: {args}")
+    subprocess_logger = _opt(_depth + 1)
+    is_logged = _is_logged(_level)
+    if is_logged:
+        subprocess_logger.log(_level, "Running subprocess: {}", args)
 
     # have to time manually so that we can pass _depth to timer.log
     # (to get the correct function name in the log)
@@ -466,24 +557,33 @@ def run_and_log_subprocess(
     # Specify stdout and stderr like this to capture output in 1 stream instead of 2
     # This way, the subprocess output is in the order it was generated
     # text=True gets the output as a string instead of bytes
-    completed_process = subprocess.run(
+    kwargs.setdefault("bufsize", SUBPROCESS_BUFSIZE)
+    with subprocess.Popen(
         args,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         text=True,
-        check=False,
         **kwargs,
-    )
+    ) as process:
+        # Read the output as it's generated and only keep the last lines so that
+        # commands with a lot of output (like ffmpeg's progress) don't use a lot of
+        # memory
+        output_tail = deque(process.stdout, maxlen=SUBPROCESS_OUTPUT_LINES)
+    # exiting the with block waits for the process to finish
     timer.stop()
-
-    subprocess_logger.log(
-        _level,
-        "returncode={} time_taken={}",
-        completed_process.returncode,
-        timer.time_taken,
+    completed_process = subprocess.CompletedProcess(
+        args, process.returncode, "".join(output_tail)
     )
-    # This has to be after the log line above this one because it resets the color
-    subprocess_logger.log(_level, "stdout=\n\033[0m{}", completed_process.stdout)
+
+    if is_logged:
+        subprocess_logger.log(
+            _level,
+            "returncode={} time_taken={}",
+            completed_process.returncode,
+            timer.time_taken,
+        )
+        # This has to be after the log line above this one because it resets the color
+        subprocess_logger.log(_level, "stdout=\n\033[0m{}", completed_process.stdout)
 
     if check:
         completed_process.check_returncode()
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
 import argparse
+import concurrent.futures
 import functools
-import json
 import os
 import pathlib
 import re
@@ -13,6 +13,7 @@ from typing import Any, Literal, overload
 
 import librosa
 import numpy as np
+import orjson
 import pandas as pd
 from numpy.typing import NDArray
 from pyannote.core import Annotation as PyannoteAnnotation
@@ -42,6 +43,9 @@ LabeledTrack = tuple[PyannoteSegment, TrackName, Label]
 TimeRange = tuple[float, float]
 
 COPY_TO_LABELED = {"copyTo": ["Labeled.children"]}
+# the stats to remove from the stats CSV before adding the new ones. Compiled once
+# instead of every time stats are saved
+STATS_REMOVE_KEYS = [re.compile(".*_snr")]
 
 
 @overload
@@ -128,28 +132,40 @@ def get_complement_times(
     return comp_times
 
 
+def _merge_sample_ranges(
+    times, num_samples: int, sr: float
+) -> tuple[NDArray[np.int_], NDArray[np.int_]]:
+    """Converts times to the starts and (exclusive) stops of the runs of samples they
+    cover, merging overlapping and touching ranges."""
+    # convert to samples the same way librosa.time_to_samples does, without
+    # librosa's overhead
+    sample_ranges = (np.array(times) * sr).astype(int).reshape(-1, 2)
+    # clip the ranges to the samples like slicing the samples would
+    sample_ranges = np.clip(sample_ranges, 0, num_samples)
+    starts, stops = sample_ranges[sample_ranges[:, 0] < sample_ranges[:, 1]].T
+    if len(starts) == 0:
+        return starts, stops
+    # Merge the ranges directly instead of marking every sample that's in them, so
+    # this doesn't depend on the length of the audio. Once the ranges are sorted, a
+    # new run of samples starts at each range that starts after all of the ranges
+    # before it have stopped
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    max_stops = np.maximum.accumulate(stops[order])
+    run_firsts = np.flatnonzero(starts[1:] > max_stops[:-1]) + 1
+    run_lasts = np.append(run_firsts - 1, len(starts) - 1)
+    run_firsts = np.insert(run_firsts, 0, 0)
+    return starts[run_firsts], max_stops[run_lasts]
+
+
 def flatten_times(times, num_samples: int, sr: float) -> list[TimeRange]:
-    is_in_times = np.full(num_samples, False)
     times = times[:]  # copy times
-    for srange in librosa.time_to_samples(times, sr=sr):
-        is_in_times[srange[0] : srange[1]] = True
-    indices = np.where(is_in_times)[0]
-    if len(indices) != 0:
-        times = [indices[0]]
-    for i in range(1, len(indices) - 1):
-        if indices[i] + 1 != indices[i + 1]:
-            times.append(indices[i])
-        if indices[i] != indices[i - 1] + 1:
-            times.append(indices[i])
-    if len(indices) != 0:
-        times.append(indices[-1])
-        times = librosa.samples_to_time(times, sr=sr)
-
-        new_times = []
-        for i in range(0, len(times), 2):
-            new_times.append((times[i], times[i + 1]))
-        times = new_times
-    return times
+    run_starts, run_stops = _merge_sample_ranges(times, num_samples, sr)
+    if len(run_starts) == 0:
+        return times
+    # Each range is from the first to the last sample of a run (stops are exclusive),
+    # so a run of 1 sample starts and ends on the same sample
+    return list(zip(run_starts / sr, (run_stops - 1) / sr))
 
 
 def get_times_duration(times: Sequence[TimeRange]) -> float:
@@ -182,33 +198,27 @@ def get_num_convo_turns(times: Sequence2D[TimeRange]) -> int:
 def samples_from_times(
     times: Sequence[TimeRange], samples: FloatArray, sr: float
 ) -> NDArray[np.float64]:
-    indices = (np.array(times) * sr).astype(int)
-    if len(indices) == 0:
-        # return [] # we have to return an ndarray instead
+    # Gather the merged runs instead of each range so that overlapping ranges don't
+    # duplicate samples. There are few runs compared to samples, so slicing them
+    # keeps memory proportional to the samples that are selected
+    run_starts, run_stops = _merge_sample_ranges(times, len(samples), sr)
+    if len(run_starts) == 0:
         return np.empty(0)
-    samps = np.empty(np.sum(np.clip(indices[:, 1] - indices[:, 0], 0, None)))
-    offset = 0
-    for start, stop in indices:
-        to = offset + stop - start if stop - start >= 0 else offset
-        samps[offset:to] = samples[start:stop]
-        offset = to
-    return samps
-
-
-def snr_from_times(
-    signal_times: Sequence[TimeRange], samples: FloatArray, sr: float, noise_rms: float
-) -> float:
-    signal_samps = samples_from_times(signal_times, samples, sr)
-    return snr.snr(signal_samps, noise_rms)
+    return np.concatenate(
+        [samples[start:stop] for start, stop in zip(run_starts, run_stops)],
+        dtype=np.float64,
+    )
 
 
-# Try applying a linear adjustment, to see if that makes it
-# more accurate and better correlations.
-def snr_with_linear_from_times(
-    signal_times: Sequence[TimeRange], samples: FloatArray, sr: float, noise_rms: float
+def rms_from_times(
+    times: Sequence[TimeRange], squared_samples: NDArray[np.float64], sr: float
 ) -> float:
-    signal_samps = samples_from_times(signal_times, samples, sr)
-    return snr.snr_with_linear_amp(signal_samps, noise_rms)
+    # takes the already squared samples so that they only have to be squared once
+    # no matter how many times' RMSs are calculated
+    squared_samps = samples_from_times(times, squared_samples, sr)
+    if len(squared_samps) == 0:
+        return 0
+    return float(np.sqrt(np.mean(squared_samps)))
 
 
 def itertracks(annot: PyannoteAnnotation) -> Iterator[Track]:
@@ -221,7 +231,10 @@ def itertracks_labeled(annot: PyannoteAnnotation) -> Iterator[LabeledTrack]:
 
 @log.Timer()
 def get_diarization(
-    path: pathlib.Path, auth_token: str, num_speakers: int | None = None
+    path: pathlib.Path,
+    auth_token: str,
+    num_speakers: int | None = None,
+    audio: AnyDict | None = None,
 ) -> tuple[dict[str, list[Segment]], dict[str, list[TimeRange]]]:
     # use global diar_pipe so that it doesn't need
     # to be re-initialized (which is time-consuming)
@@ -231,6 +244,7 @@ def get_diarization(
     # would have to wait a while just to see the help message.
     # We don't need to do `if "Pipeline" in globals()` because python caches imports,
     # so it isn't actually getting reimported every time get_diarization is called
+    import torch
     from pyannote.audio import Pipeline
 
     if "diar_pipe" not in globals():  # diar_pipe hasn't been initialized yet
@@ -242,14 +256,19 @@ def get_diarization(
             diar_pipe = Pipeline.from_pretrained(
                 "pyannote/speaker-diarization-3.1", use_auth_token=auth_token
             )
+            # pipelines run on the CPU unless they're moved to the GPU
+            if torch.cuda.is_available():
+                diar_pipe.to(torch.device("cuda"))
 
+    # the pipeline can take the already loaded audio instead of loading it from path
+    pipe_input = audio if audio is not None else path
     try:
         logger.trace("Running diarization pipeline")
         if num_speakers is not None:
             # Ignore "diar_pipe is possibly unbound" because we know it's bound above
-            diar: PyannoteAnnotation = diar_pipe(path, num_speakers=num_speakers)  # type: ignore # noqa: E501
+            diar: PyannoteAnnotation = diar_pipe(pipe_input, num_speakers=num_speakers)  # type: ignore # noqa: E501
         else:
-            diar: PyannoteAnnotation = diar_pipe(path)  # type: ignore
+            diar: PyannoteAnnotation = diar_pipe(pipe_input)  # type: ignore
     except ValueError:
         logger.warning("{} failed diarization or has no speakers.", path)
         # spkrs_segs: dict[str, list[Segment]] = {}
@@ -283,10 +302,12 @@ def get_vad(
     auth_token: str,
     onset: float | None = None,
     offset: float | None = None,
+    audio: AnyDict | None = None,
 ) -> tuple[list[Segment], list[TimeRange]]:
     # use global vad_pipe so that it doesn't need
     # to be re-initialized (which is time-consuming)
     global vad_pipe
+    import torch
     from pyannote.audio import Pipeline
 
     if "vad_pipe" not in globals():  # vad_pipe hasn't been initialized yet
@@ -298,6 +319,9 @@ def get_vad(
             vad_pipe = Pipeline.from_pretrained(
                 "pyannote/voice-activity-detection", use_auth_token=auth_token
             )
+            # pipelines run on the CPU unless they're moved to the GPU
+            if torch.cuda.is_available():
+                vad_pipe.to(torch.device("cuda"))
     # Ignore "vad_pipe is possibly unbound" because we know it's bound above
     old_params = vad_pipe.parameters(instantiated=True)  # type: ignore
 
@@ -311,7 +335,8 @@ def get_vad(
     vad_pipe.instantiate(old_params)  # type: ignore
 
     logger.trace("Running VAD pipeline")
-    vad: PyannoteAnnotation = vad_pipe(path)  # type: ignore
+    # the pipeline can take the already loaded audio instead of loading it from path
+    vad: PyannoteAnnotation = vad_pipe(audio if audio is not None else path)  # type: ignore # noqa: E501
     logger.trace("Formatting VAD results as segments")
     # format the vad segments for peaks
     vad_segs: list[Segment] = []
@@ -342,39 +367,66 @@ def get_auth_token(auth_token: str | None) -> str:
     return auth_token
 
 
-def route_dir(dir: pathlib.Path, scan_dir: bool = True, **kwargs) -> None:
-    logger.debug("Running process_audio on each file in {}", dir)
-    for path in dir.iterdir():
-        route_file(path, scan_dir=scan_dir, **kwargs)
-
-
-def route_file(*paths: pathlib.Path, scan_dir: bool = True, **kwargs) -> None:
+def find_files(*paths: pathlib.Path, scan_dir: bool = True) -> Iterator[pathlib.Path]:
+    """Finds the audio and video files in the different types of paths input into this
+    script."""
     if len(paths) == 0:
         # if no file or directory given, use directory script was called from
         paths = (pathlib.Path.cwd(),)
-    # if multiple files (or directories) given, run function on each one
-    elif len(paths) > 1:
-        for path in paths:
-            route_file(path, scan_dir=scan_dir, **kwargs)
-        # stop function because all of the processing is
-        # done in the function calls in the for loop
-        return
 
-    path = paths[0].absolute()  # paths[0] is--at this point--the only argument in paths
-
-    # if file.path is an audio or video file, process it
-    if path.suffix.casefold() in AUDIO_EXTS or path.suffix.casefold() in VIDEO_EXTS:
-        process_audio(path, **kwargs)
+    for path in paths:
+        path = path.absolute()
+
+        # if path is an audio or video file, process it
+        if path.suffix.casefold() in AUDIO_EXTS or path.suffix.casefold() in VIDEO_EXTS:
+            yield path
+
+        # find the files in path if it is a dir and scan_dir is True
+        elif path.is_dir() and scan_dir:
+            if path.name == "data":
+                # the data dir was passed so find files in data/audio, data/video, and
+                # data/views. A project might not have all of them, so skip whichever
+                # directory doesn't exist instead of erroring
+                dirs = [path / subdir for subdir in ("audio", "video", "views")]
+                dirs, scan_subdirs = [dir for dir in dirs if dir.is_dir()], True
+            else:
+                dirs, scan_subdirs = [path], False
+            for dir in dirs:
+                logger.debug("Finding files to process in {}", dir)
+                # os.scandir caches each entry's type from the directory listing, so
+                # checking is_dir doesn't need another stat call like Path.iterdir does
+                with os.scandir(dir) as entries:
+                    for entry in entries:
+                        ext = os.path.splitext(entry.name)[1].casefold()
+                        if ext in AUDIO_EXTS or ext in VIDEO_EXTS:
+                            yield pathlib.Path(entry.path)
+                        elif scan_subdirs and entry.is_dir():
+                            yield from find_files(
+                                pathlib.Path(entry.path), scan_dir=True
+                            )
+
+
+def route_file(
+    *paths: pathlib.Path, scan_dir: bool = True, jobs: int = 1, **kwargs
+) -> None:
+    """Handles the different types of files that can be input into this script."""
+    # find all of the files before processing any of them since processing a video
+    # creates a wav next to it, which shouldn't be found and processed too
+    media_paths = list(find_files(*paths, scan_dir=scan_dir))
+    if jobs == 1:
+        for path in media_paths:
+            process_audio(path, **kwargs)
+        return
 
-    # run process audio on every file in file.path if it is a dir and scan_dir is True
-    elif path.is_dir() and scan_dir:
-        # the data dir was passed so run on data/audio and data/video
-        if path.name == "data":
-            route_dir(path / "audio", scan_dir=scan_dir, **kwargs)
-            route_dir(path / "video", scan_dir=scan_dir, **kwargs)
-            route_dir(path / "views", scan_dir=scan_dir, **kwargs)
-        else:
-            route_dir(path, scan_dir=False, **kwargs)
+    # Each file is processed independently and ffmpeg, audiowaveform, librosa, and
+    # the pipelines all take a while, so process multiple files at once. Each process
+    # loads its own pipelines
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        futures = [
+            executor.submit(process_audio, path, **kwargs) for path in media_paths
+        ]
+        for future in futures:
+            future.result()  # raises the exception if process_audio failed
 
 
 def run_from_pipeline(args: MutableMapping) -> None:
@@ -449,17 +501,14 @@ def process_audio(
     segs_path.parent.mkdir(parents=True, exist_ok=True)
     stats_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # if the audio isn't in wav format, it'll need to be
-    # converted to wav (because the pipelines requires wav)
+    # if the file is a video, its audio will need to be converted to wav (because
+    # audiowaveform and librosa can't read videos). Audio files can be read as is,
+    # and the pipelines are given the samples that librosa loads
     made_wav = False
-    if path.suffix.casefold() != ".wav":
+    if path.suffix.casefold() in VIDEO_EXTS:
         old_path = path
         new_path = path.with_suffix(".wav")
-        if (
-            reprocess
-            or not segs_path.exists()
-            or (not waveform_path.exists() and path.suffix.casefold() in VIDEO_EXTS)
-        ):
+        if reprocess or not segs_path.exists() or not waveform_path.exists():
             logger.debug("{} is not a wav file. Creating {}", path.name, new_path.name)
             try:
                 util.ffmpeg(old_path, new_path)
@@ -473,33 +522,58 @@ def process_audio(
     # only recreate the waveform if it doesn't already exist
     if waveform_path.exists() and not reprocess:
         logger.info("{} already exists. To recreate it, pass -r", waveform_path)
+    elif split_channels:  # also make a mono wavforms for viewing if user wants
+        logger.debug("Creating split and mono waveforms")
+        mono_waveform_path = (
+            data_dir / "waveforms" / parent_dir / f"{path.stem}-waveform-mono.json"
+        )
+        # the waveforms don't depend on each other, so run both audiowaveforms at
+        # the same time instead of waiting for the first to finish
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(
+                    util.audiowaveform, path, waveform_path, split_channels=True
+                ),
+                executor.submit(
+                    util.audiowaveform, path, mono_waveform_path, split_channels=False
+                ),
+            ]
+            for future in futures:
+                future.result()  # raises the exception if audiowaveform failed
     else:  # create the waveform
-        util.audiowaveform(path, waveform_path, split_channels=split_channels)
-        if split_channels:  # also make a mono wavforms for viewing if user wants
-            logger.debug("Creating mono waveform")
-            mono_waveform_path = (
-                data_dir / "waveforms" / parent_dir / f"{path.stem}-waveform-mono.json"
-            )
-            util.audiowaveform(path, mono_waveform_path, split_channels=False)
+        util.audiowaveform(path, waveform_path, split_channels=False)
 
     if segs_path.exists() and not reprocess:
         logger.info("{} has already been processed. To reprocess it, pass -r", path)
     else:
         samples, sr = librosa.load(path, sr=None, mono=not split_channels)
         mono_samples = librosa.to_mono(samples)
+        # square the samples once for all of the RMSs calculated in calc_stats
+        mono_samples_sq = np.square(mono_samples, dtype=np.float64)
         duration = librosa.get_duration(y=mono_samples, sr=sr)
 
         logger.debug("sr={} duration={:.3f}", sr, duration)
 
+        # lazy import torch for the same reason Pipeline is lazily imported
+        import torch
+
+        # Give the pipelines the samples that were already loaded so that they don't
+        # each have to decode the file again. They downmix to mono anyways, and
+        # they resample the waveform to the rate their models need
+        audio = {
+            "waveform": torch.from_numpy(mono_samples[np.newaxis]),
+            "sample_rate": sr,
+        }
+
         # Do speaker diarization (just make spkrs_segs and
         # spkrs_times only take before and after filter_start and filter_stop)
         spkrs_segs, spkrs_times = get_diarization(
-            path, auth_token, num_speakers=num_speakers
+            path, auth_token, num_speakers=num_speakers, audio=audio
         )
 
         # Do vad (just make spkrs_segs and spkrs_times only take before and
         # after filter_start and filter_stop)
-        vad_segs, vad_times = get_vad(path, auth_token, onset, offset)
+        vad_segs, vad_times = get_vad(path, auth_token, onset, offset, audio=audio)
 
         # this is to allow for the stats to be calculated on the entire
         # file or a subsection like a run in a view
@@ -573,6 +647,7 @@ def process_audio(
                 # don't need to give options because the Non-VAD PeaksGroup handles it
                 non_vad_segs.append(format_segment(start, end, "#b59896", "Non-VAD"))
             non_vad_samps = samples_from_times(non_vad_times, mono_samples, sr)
+            non_vad_rms = rms_from_times(non_vad_times, mono_samples_sq, sr)
 
             logger.trace("Calculating SNRs")
 
@@ -608,45 +683,40 @@ def process_audio(
             # if not noise_times:
             # raise Exception("No non-vad to calculate snr with for file " + str(path))
 
-            noise_samps = samples_from_times(noise_times, mono_samples, sr)
-            noise_rms = snr.rms(noise_samps)
+            noise_rms = rms_from_times(noise_times, mono_samples_sq, sr)
             if noise_rms == 0:
                 # can't divide by 0, be less picky
                 # and take non vad not just speech_pause
-                noise_rms = snr.rms(non_vad_samps)
+                noise_rms = non_vad_rms
 
-            non_vad_samps = samples_from_times(non_vad_times, mono_samples, sr)
-            non_vad_rms = snr.rms(non_vad_samps)
+            # the signals' RMSs are the same for both kinds of noise, so only
+            # calculate them once
+            spkrs_rmss = {
+                spkr: rms_from_times(filtered_spkrs_times[spkr], mono_samples_sq, sr)
+                for spkr in spkrs
+            }
 
             spkrs_snrs = {
-                spkr: snr_from_times(
-                    filtered_spkrs_times[spkr], mono_samples, sr, noise_rms
-                )
-                for spkr in spkrs
+                spkr: snr.snr(spkr_rms, noise_rms)
+                for spkr, spkr_rms in spkrs_rmss.items()
             }
 
             # TODO add this to stats if linear is found to be better
             # spkrs_with_linear_snrs = {
-            #     spkr: snr_with_linear_from_times(
-            #         filtered_spkrs_times[spkr], mono_samples, sr, noise_rms
-            #     )
-            #     for spkr in spkrs
+            #     spkr: snr.snr_with_linear_amp(spkr_rms, noise_rms)
+            #     for spkr, spkr_rms in spkrs_rmss.items()
             # }
 
             spkrs_non_vad_snrs = {
-                spkr: snr_from_times(
-                    filtered_spkrs_times[spkr], mono_samples, sr, non_vad_rms
-                )
-                for spkr in spkrs
+                spkr: snr.snr(spkr_rms, non_vad_rms)
+                for spkr, spkr_rms in spkrs_rmss.items()
             }
 
             # TODO add this to stats if linear and non-vad as noise
             # is found to be better
             # spkrs_non_vad_with_linear_snrs = {
-            #     spkr: snr_with_linear_from_times(
-            #         filtered_spkrs_times[spkr], mono_samples, sr, non_vad_rms
-            #     )
-            #     for spkr in spkrs
+            #     spkr: snr.snr_with_linear_amp(spkr_rms, non_vad_rms)
+            #     for spkr, spkr_rms in spkrs_rmss.items()
             # }
 
             # Defining non_main_diar_times outside the if statement is necessary so
@@ -720,8 +790,8 @@ def process_audio(
                 logger.info("Saving segments to {}", segs_path)
 
                 try:
-                    with open(segs_path, "r") as annot_file:
-                        annot_data = json.load(annot_file)
+                    # orjson parses the bytes directly, which is faster than json
+                    annot_data = orjson.loads(segs_path.read_bytes())
 
                     if annot_data.get("formatVersion") != 3:
                         # raise error to catch and rewrite as new format
@@ -749,58 +819,52 @@ def process_audio(
 
                     tree_items["annotations"] = annotations
 
-                except FileNotFoundError or json.JSONDecodeError or ValueError:
+                # orjson.JSONDecodeError is a subclass of ValueError
+                except (FileNotFoundError, ValueError):
                     # either file doesn't exist yet,
                     # it's empty, or it's in the old format
                     # so we don't need to do anything special with tree_items
                     # (just save it as is, hence the empty except block)
                     pass
 
-                with segs_path.open("w") as segs_file:
-                    json.dump(tree_items, segs_file, indent=2)
+                segs_path.write_bytes(
+                    orjson.dumps(
+                        tree_items,
+                        option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY,
+                    )
+                )
 
             logger.trace("Calculating stats")
 
+            diar_rms = rms_from_times(filtered_diar_times, mono_samples_sq, sr)
+            vad_rms = rms_from_times(filtered_vad_times, mono_samples_sq, sr)
             # uses speech pause as noise
-            overall_snr = snr_from_times(
-                filtered_diar_times, mono_samples, sr, noise_rms
-            )
+            overall_snr = snr.snr(diar_rms, noise_rms)
             # uses non vad as noise
-            overall_non_vad_snr = snr_from_times(
-                filtered_diar_times, mono_samples, sr, non_vad_rms
-            )
+            overall_non_vad_snr = snr.snr(diar_rms, non_vad_rms)
             # uses speech pause as noise
-            overall_with_linear_snr = snr_with_linear_from_times(
-                filtered_diar_times, mono_samples, sr, noise_rms
-            )
+            overall_with_linear_snr = snr.snr_with_linear_amp(diar_rms, noise_rms)
             # uses non vad as noise
-            overall_non_vad_with_linear_snr = snr_with_linear_from_times(
-                filtered_diar_times, mono_samples, sr, non_vad_rms
+            overall_non_vad_with_linear_snr = snr.snr_with_linear_amp(
+                diar_rms, non_vad_rms
             )
             # uses vad as overall signal, speech pause as noise
-            overall_vad_snr = snr_from_times(
-                filtered_vad_times, mono_samples, sr, noise_rms
-            )
+            overall_vad_snr = snr.snr(vad_rms, noise_rms)
             # uses vad as overall signal, non vad as noise
-            overall_non_vad_vad_snr = snr_from_times(
-                filtered_vad_times, mono_samples, sr, non_vad_rms
-            )
+            overall_non_vad_vad_snr = snr.snr(vad_rms, non_vad_rms)
             # uses vad as overall signal, speech pause as noise
-            overall_vad_with_linear_snr = snr_with_linear_from_times(
-                filtered_diar_times, mono_samples, sr, noise_rms
-            )
+            overall_vad_with_linear_snr = snr.snr_with_linear_amp(diar_rms, noise_rms)
             # uses vad as overall signal, non vad as noise
-            overall_non_vad_vad_with_linear_snr = snr_with_linear_from_times(
-                filtered_diar_times, mono_samples, sr, non_vad_rms
+            overall_non_vad_vad_with_linear_snr = snr.snr_with_linear_amp(
+                diar_rms, non_vad_rms
             )
 
             if len(spkrs_snrs) > 1:
-                overall_wout_main_snr = snr_from_times(
-                    non_main_diar_times, mono_samples, sr, noise_rms
-                )
-                overall_non_vad_wout_main_snr = snr_from_times(
-                    non_main_diar_times, mono_samples, sr, non_vad_rms
+                non_main_diar_rms = rms_from_times(
+                    non_main_diar_times, mono_samples_sq, sr
                 )
+                overall_wout_main_snr = snr.snr(non_main_diar_rms, noise_rms)
+                overall_non_vad_wout_main_snr = snr.snr(non_main_diar_rms, non_vad_rms)
             else:
                 overall_wout_main_snr = "N/A"
                 overall_non_vad_wout_main_snr = "N/A"
@@ -890,25 +954,30 @@ def process_audio(
                     channel_names = [f"channel{i}" for i in range(samples.shape[0])]
                 logger.debug("channel_names={}", channel_names)
                 for i, channel_name in enumerate(channel_names):
-                    c_noise_samps = samples_from_times(noise_times, samples[i], sr)
-                    c_noise_rms = snr.rms(c_noise_samps)
+                    c_samples_sq = np.square(samples[i], dtype=np.float64)
+                    c_noise_rms = rms_from_times(noise_times, c_samples_sq, sr)
                     if c_noise_rms == 0:
                         logger.debug('channel "{}"\'s noise rms is 0', channel_name)
                         # can't divide by 0, be less picky and take
                         # non vad not just speech_pause
-                        c_noise_rms = snr.rms(non_vad_samps)
+                        c_noise_rms = non_vad_rms
                     c_spkrs_snrs = {
-                        spkr: snr_from_times(
-                            filtered_spkrs_times[spkr], samples[i], sr, c_noise_rms
+                        spkr: snr.snr(
+                            rms_from_times(
+                                filtered_spkrs_times[spkr], c_samples_sq, sr
+                            ),
+                            c_noise_rms,
                         )
                         for spkr in spkrs
                     }
-                    c_overall_snr = snr_from_times(
-                        filtered_diar_times, samples[i], sr, c_noise_rms
+                    c_overall_snr = snr.snr(
+                        rms_from_times(filtered_diar_times, c_samples_sq, sr),
+                        c_noise_rms,
                     )
                     if len(spkrs_snrs) > 1:
-                        c_overall_wout_main_snr = snr_from_times(
-                            non_main_diar_times, samples[i], sr, c_noise_rms
+                        c_overall_wout_main_snr = snr.snr(
+                            rms_from_times(non_main_diar_times, c_samples_sq, sr),
+                            c_noise_rms,
                         )
                     else:
                         c_overall_wout_main_snr = "N/A"
@@ -919,12 +988,11 @@ def process_audio(
 
                     for spkr, spkr_snr in c_spkrs_snrs.items():
                         stats[f"{channel_name}_{spkr}_snr_db"] = spkr_snr
-            remove_keys = [re.compile(".*_snr")]
             os.makedirs(os.path.dirname(stats_path), exist_ok=True)
             if not os.path.exists(stats_path):
                 with open(stats_path, "w"):
                     pass
-            util.add_to_csv(stats_path, stats, remove_keys=remove_keys)
+            util.add_to_csv(stats_path, stats, remove_keys=STATS_REMOVE_KEYS)
 
         calc_stats()
         if (
@@ -950,7 +1018,7 @@ def process_audio(
                 calc_stats(start_time, end_time, stats_path_run, False)
 
     # if we converted to wav, remove that wav file
-    # (since it was only needed for the pipelines)
+    # (since it was only needed for audiowaveform and librosa)
     if made_wav:
         logger.debug("Deleting {}", path)
         path.unlink()
@@ -1006,6 +1074,16 @@ if __name__ == "__main__":
         type=int,
         help="Number of speakers if known from face clustering",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help=(
+            "The number of files to process at once. Each file is processed in its own"
+            " process, which loads its own pipelines. Default is 1."
+        ),
+    )
     log.add_log_level_argument(parser)
 
     args = vars(parser.parse_args())
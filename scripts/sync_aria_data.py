@@ -94,7 +94,9 @@ def sync_poses(
 ):
     """ """
     for i in range(len(pose_paths)):
-        pose = np.genfromtxt(pose_paths[i], delimiter=",", skip_header=1)
+        # loadtxt parses in C, unlike genfromtxt. ndmin=2 keeps a pose file with 1 row
+        # 2D so that it can still be indexed by column
+        pose = np.loadtxt(pose_paths[i], delimiter=",", skiprows=1, ndmin=2)
         pose[:, 0] -= pose[0, 0]  # make the timestamps start at 0.0
         pose = pose[pose[:, 0] >= offsets[i]]  # filter out poses where times < offset
         pose = pose[pose[:, 0] <= last_time]  # trim to match length of audio and video
@@ -82,6 +82,7 @@ struct whisper_params {
     bool print_colors   = false;
     bool print_progress = false;
     bool no_timestamps  = false;
+    bool serve          = false;
 
     std::string language = "en";
     std::string prompt;
@@ -121,6 +122,7 @@ bool whisper_params_parse(int argc, char ** argv, whisper_params & params) {
         else if (arg == "-m"    || arg == "--model")          { params.model          = argv[++i]; }
         else if (arg == "-i"    || arg == "--input")          { params.fname_inp      = argv[++i]; }
         else if (arg == "-o"    || arg == "--output")         { params.fname_out      = argv[++i]; }
+        else if (                  arg == "--serve")          { params.serve          = true; }
         else {
             fprintf(stderr, "error: unknown argument: %s\n", arg.c_str());
             whisper_print_usage(argc, argv, params);
@@ -157,6 +159,7 @@ void whisper_print_usage(int /*argc*/, char ** argv, const whisper_params & para
     fprintf(stderr, "  -m FNAME, --model FNAME    [%-7s] model path\n",                                     params.model.c_str());
     fprintf(stderr, "  -i FNAME, --input FNAME    [%-7s] input WAV file path\n",                            "");
     fprintf(stderr, "  -o FNAME, --output FNAME   [%-7s] output JSON file path\n",                          "");
+    fprintf(stderr, "            --serve          [%-7s] keep the model loaded and read jobs from stdin\n",  params.serve ? "true" : "false");
     fprintf(stderr, "\n");
 }
 
@@ -225,86 +228,28 @@ bool output_transcription(struct whisper_context * ctx, const char * fname) {
     return true;
 }
 
-int main(int argc, char ** argv) {
-    whisper_params params;
-
-    if (whisper_params_parse(argc, argv, params) == false) {
-        return 1;
-    }
-
-    if (params.fname_inp.empty()) {
-        fprintf(stderr, "error: no input file specified\n");
-        whisper_print_usage(argc, argv, params);
-        return 2;
-    }
-
-    if (params.fname_out.empty()) {
-        fprintf(stderr, "error: no output file specified\n");
-        whisper_print_usage(argc, argv, params);
-        return 2;
-    }
-
-    if (params.language != "auto" && whisper_lang_id(params.language.c_str()) == -1) {
-        fprintf(stderr, "error: unknown language '%s'\n", params.language.c_str());
-        whisper_print_usage(argc, argv, params);
-        exit(0);
-    }
-
-    // whisper init
-
-    struct whisper_context * ctx = whisper_init_from_file(params.model.c_str());
-
-    if (ctx == nullptr) {
-        fprintf(stderr, "error: failed to initialize whisper context\n");
-        return 3;
-    }
-
-    // initial prompt
-    std::vector<whisper_token> prompt_tokens;
-
-    if (!params.prompt.empty()) {
-        prompt_tokens.resize(1024);
-        prompt_tokens.resize(whisper_tokenize(ctx, params.prompt.c_str(), prompt_tokens.data(), prompt_tokens.size()));
-
-        fprintf(stderr, "\n");
-        fprintf(stderr, "initial prompt: '%s'\n", params.prompt.c_str());
-        fprintf(stderr, "initial tokens: [ ");
-        for (int i = 0; i < (int) prompt_tokens.size(); ++i) {
-            fprintf(stderr, "%d ", prompt_tokens[i]);
-        }
-        fprintf(stderr, "]\n");
-    }
-
-    const auto fname_inp = params.fname_inp;
-    const auto fname_out = params.fname_out;
-
+// transcribes the WAV in wav_data (or in the file fname_inp if wav_data is empty)
+// and writes the words to fname_out. Returns 0 on success or an error code otherwise
+int transcribe(
+    struct whisper_context * ctx,
+    const whisper_params & params,
+    const std::vector<whisper_token> & prompt_tokens,
+    const std::string & fname_inp,
+    const std::vector<uint8_t> & wav_data,
+    const std::string & fname_out
+) {
     std::vector<float> pcmf32; // mono-channel F32 PCM
     std::vector<std::vector<float>> pcmf32s; // stereo-channel F32 PCM
 
     // WAV input
     {
         drwav wav;
-        std::vector<uint8_t> wav_data; // used for pipe input from stdin
-
-        if (fname_inp == "-") {
-            {
-                uint8_t buf[1024];
-                while (true)
-                {
-                    const size_t n = fread(buf, 1, sizeof(buf), stdin);
-                    if (n == 0) {
-                        break;
-                    }
-                    wav_data.insert(wav_data.end(), buf, buf + n);
-                }
-            }
 
+        if (!wav_data.empty()) {
             if (drwav_init_memory(&wav, wav_data.data(), wav_data.size(), nullptr) == false) {
                 fprintf(stderr, "error: failed to open WAV file from stdin\n");
                 return 4;
             }
-
-            fprintf(stderr, "%s: read %zu bytes from stdin\n", __func__, wav_data.size());
         }
         else if (drwav_init_file(&wav, fname_inp.c_str(), nullptr) == false) {
             fprintf(stderr, "error: failed to open '%s' as WAV file\n", fname_inp.c_str());
@@ -312,22 +257,22 @@ int main(int argc, char ** argv) {
         }
 
         if (wav.channels != 1 && wav.channels != 2) {
-            fprintf(stderr, "%s: WAV file '%s' must be mono or stereo\n", argv[0], fname_inp.c_str());
+            fprintf(stderr, "%s: WAV file '%s' must be mono or stereo\n", __func__, fname_inp.c_str());
             return 6;
         }
 
         if (params.diarize && wav.channels != 2 && params.no_timestamps == false) {
-            fprintf(stderr, "%s: WAV file '%s' must be stereo for diarization and timestamps have to be enabled\n", argv[0], fname_inp.c_str());
+            fprintf(stderr, "%s: WAV file '%s' must be stereo for diarization and timestamps have to be enabled\n", __func__, fname_inp.c_str());
             return 6;
         }
 
         if (wav.sampleRate != WHISPER_SAMPLE_RATE) {
-            fprintf(stderr, "%s: WAV file '%s' must be %i kHz\n", argv[0], fname_inp.c_str(), WHISPER_SAMPLE_RATE/1000);
+            fprintf(stderr, "%s: WAV file '%s' must be %i kHz\n", __func__, fname_inp.c_str(), WHISPER_SAMPLE_RATE/1000);
             return 8;
         }
 
         if (wav.bitsPerSample != 16) {
-            fprintf(stderr, "%s: WAV file '%s' must be 16-bit\n", argv[0], fname_inp.c_str());
+            fprintf(stderr, "%s: WAV file '%s' must be 16-bit\n", __func__, fname_inp.c_str());
             return 9;
         }
 
@@ -401,14 +346,117 @@ int main(int argc, char ** argv) {
         }
 
         if (whisper_full_parallel(ctx, wparams, pcmf32.data(), pcmf32.size(), params.n_processors) != 0) {
-            fprintf(stderr, "%s: failed to process audio\n", argv[0]);
+            fprintf(stderr, "%s: failed to process audio\n", __func__);
             return 10;
         }
     }
 
-    output_transcription(ctx, fname_out.c_str());
+    if (!output_transcription(ctx, fname_out.c_str())) {
+        return 11;
+    }
+
+    return 0;
+}
+
+int main(int argc, char ** argv) {
+    whisper_params params;
+
+    if (whisper_params_parse(argc, argv, params) == false) {
+        return 1;
+    }
+
+    if (params.fname_inp.empty() && !params.serve) {
+        fprintf(stderr, "error: no input file specified\n");
+        whisper_print_usage(argc, argv, params);
+        return 2;
+    }
+
+    if (params.fname_out.empty() && !params.serve) {
+        fprintf(stderr, "error: no output file specified\n");
+        whisper_print_usage(argc, argv, params);
+        return 2;
+    }
+
+    if (params.language != "auto" && whisper_lang_id(params.language.c_str()) == -1) {
+        fprintf(stderr, "error: unknown language '%s'\n", params.language.c_str());
+        whisper_print_usage(argc, argv, params);
+        exit(0);
+    }
+
+    // whisper init
+
+    struct whisper_context * ctx = whisper_init_from_file(params.model.c_str());
+
+    if (ctx == nullptr) {
+        fprintf(stderr, "error: failed to initialize whisper context\n");
+        return 3;
+    }
+
+    // initial prompt
+    std::vector<whisper_token> prompt_tokens;
+
+    if (!params.prompt.empty()) {
+        prompt_tokens.resize(1024);
+        prompt_tokens.resize(whisper_tokenize(ctx, params.prompt.c_str(), prompt_tokens.data(), prompt_tokens.size()));
+
+        fprintf(stderr, "\n");
+        fprintf(stderr, "initial prompt: '%s'\n", params.prompt.c_str());
+        fprintf(stderr, "initial tokens: [ ");
+        for (int i = 0; i < (int) prompt_tokens.size(); ++i) {
+            fprintf(stderr, "%d ", prompt_tokens[i]);
+        }
+        fprintf(stderr, "]\n");
+    }
+
+    if (params.serve) {
+        // each job is a line containing the output path and the size of the WAV data
+        // separated by a tab, followed by that many bytes of WAV data. The result of
+        // each job is written to stdout as a line containing the returned error code
+        std::string line;
+        while (std::getline(std::cin, line)) {
+            const auto tab = line.rfind('\t');
+            if (tab == std::string::npos) {
+                fprintf(stderr, "error: invalid job '%s'\n", line.c_str());
+                std::cout << 12 << std::endl;
+                continue;
+            }
+            const std::string fname_out = line.substr(0, tab);
+            const size_t n_bytes = std::stoull(line.substr(tab + 1));
+
+            std::vector<uint8_t> wav_data(n_bytes);
+            std::cin.read(reinterpret_cast<char *>(wav_data.data()), n_bytes);
+            if ((size_t) std::cin.gcount() != n_bytes) {
+                fprintf(stderr, "error: expected %zu bytes of WAV data\n", n_bytes);
+                break;
+            }
+
+            std::cout << transcribe(ctx, params, prompt_tokens, "-", wav_data, fname_out) << std::endl;
+        }
+
+        whisper_free(ctx);
+
+        return 0;
+    }
+
+    std::vector<uint8_t> wav_data; // used for pipe input from stdin
+
+    if (params.fname_inp == "-") {
+        uint8_t buf[1024];
+        while (true)
+        {
+            const size_t n = fread(buf, 1, sizeof(buf), stdin);
+            if (n == 0) {
+                break;
+            }
+            wav_data.insert(wav_data.end(), buf, buf + n);
+        }
+
+        fprintf(stderr, "%s: read %zu bytes from stdin\n", __func__, wav_data.size());
+    }
+
+    const int ret = transcribe(ctx, params, prompt_tokens, params.fname_inp, wav_data, params.fname_out);
 
     whisper_free(ctx);
 
-    return 0;
+    return ret;
 }
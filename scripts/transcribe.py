@@ -1,16 +1,33 @@
 import argparse
-import json
+import asyncio
+import functools
+import os
 import pathlib
+import subprocess
+import threading
+from collections import deque
+from collections.abc import Iterable, Iterator
 from typing import Sequence
 
+import orjson
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 import log
 import util
-from _types import PeaksGroup, TreeItem
+from _types import PeaksGroup, StrPath, TreeItem
 from constants import AUDIO_EXTS, DATA_DIR, SCRIPTS_DIR, VIDEO_EXTS
 from log import logger
 
 TRANSCRIBE_SCRIPT = SCRIPTS_DIR / "transcribe"
 BASE_MODEL = SCRIPTS_DIR / "models/whisper-base.en.bin"
+MEDIA_EXTS = frozenset(ext.casefold() for ext in AUDIO_EXTS | VIDEO_EXTS)
+TRANSCRIPTIONS_DIR = DATA_DIR / "transcriptions"
+ANNOTATIONS_DIR = DATA_DIR / "annotations"
+_MEDIA_ROOTS = (str(DATA_DIR / "audio"), str(DATA_DIR / "video"))
 
 
 def format_tree_item(
@@ -33,42 +50,235 @@ def format_word(id: str, labelText: str, time: float, options: dict | None = Non
     return format_tree_item("Word", [word], options)
 
 
-def route_dir(dir, scan_dir=True, **kwargs):
-    logger.trace(f"Running transcribe on each file in {dir}")
-    for path in dir.iterdir():
-        route_file(path, scan_dir=scan_dir, **kwargs)
-
+class WhisperDaemon:
+    """Keeps a transcribe process running so that the model is only loaded once.
+
+    The process is started when the first file is transcribed and is stopped when
+    the context manager exits. Each job sends the WAV data over stdin, so no
+    temporary files are needed.
+
+    Parameters
+    ----------
+    model : pathlib.Path, default=BASE_MODEL
+        Path to the model to use.
+    max_len : int, default=1
+        Maximum number of characters per time segment.
+    """
+
+    def __init__(self, model: pathlib.Path = BASE_MODEL, max_len: int = 1):
+        self.model = model
+        self.max_len = max_len
+        self.process: subprocess.Popen | None = None
+        # files are transcribed in multiple threads but the daemon handles 1 at a time
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        args = [TRANSCRIBE_SCRIPT, "-m", self.model, "-ml", str(self.max_len)]
+        args.append("--serve")
+        logger.debug("Starting transcribe daemon: {}", args)
+        self.process = subprocess.Popen(
+            args, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
 
-def route_file(*paths: pathlib.Path, scan_dir=True, **kwargs):
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()  # type: ignore
+            self.process.wait()
+            self.process = None
+
+    def transcribe(self, wav_data: bytes, output_path: pathlib.Path):
+        """Transcribes the WAV in `wav_data` and writes the words to `output_path`.
+
+        Raises
+        ------
+        RuntimeError
+            If the daemon fails to transcribe the audio.
+        """
+        with self.lock:
+            if self.process is None:
+                self.start()
+            stdin, stdout = self.process.stdin, self.process.stdout  # type: ignore
+            stdin.write(f"{output_path}\t{len(wav_data)}\n".encode())
+            stdin.write(wav_data)
+            stdin.flush()
+            returncode = stdout.readline().strip()
+        if returncode != b"0":
+            raise RuntimeError(
+                f"Transcribe daemon failed on {output_path} (returncode={returncode})"
+            )
+
+
+def find_files(*paths: pathlib.Path, scan_dir: bool = True) -> Iterator[pathlib.Path]:
     if len(paths) == 0:
         # if no file or directory given, use directory script was called from
         paths = (pathlib.Path.cwd(),)
-    elif len(paths) > 1:
-        for path in paths:
-            route_file(path, scan_dir=scan_dir, **kwargs)
-        # stop function because all of the processing is
-        # done in the function calls in the for loop
-        return
 
-    path = paths[0].absolute()  # paths[0] is--at this point--the only argument in paths
+    for path in paths:
+        path = path.absolute()
 
-    # if file.path is an audio or video file, transcribe it
-    if path.suffix.casefold() in AUDIO_EXTS or path.suffix.casefold() in VIDEO_EXTS:
-        transcribe(path, **kwargs)
+        # if path is an audio or video file, it needs to be transcribed
+        if path.suffix.casefold() in MEDIA_EXTS:
+            yield path
+            continue
+        # only find the files in path if it is a dir and scan_dir is True
+        elif not (path.is_dir() and scan_dir):
+            continue
 
-    # run process audio on every file in file.path if it is a dir and scan_dir is True
-    elif path.is_dir() and scan_dir:
+        # directories waiting to be scanned, paired with whether to scan their subdirs.
+        # Using a queue instead of recursing means no stack frame per directory
+        dirs: deque[tuple[StrPath, bool]] = deque()
         if path.name == "data":
-            # the data dir was passed so run on data/audio and data/video
-            route_dir(path / "audio", scan_dir=scan_dir, **kwargs)
-            route_dir(path / "video", scan_dir=scan_dir, **kwargs)
+            # the data dir was passed so find files in data/audio and data/video
+            for subdir in ("audio", "video"):
+                # a project might only have audio (or only video), so skip
+                # whichever directory doesn't exist instead of erroring
+                if (path / subdir).is_dir():
+                    dirs.append((path / subdir, True))
         else:
-            route_dir(path, scan_dir=False, **kwargs)
+            dirs.append((path, False))
+
+        while dirs:
+            dir, scan_subdirs = dirs.popleft()
+            logger.trace(f"Finding files to transcribe in {dir}")
+            # os.scandir caches each entry's type from the directory listing, so
+            # checking is_dir doesn't need another stat call like Path.iterdir does
+            with os.scandir(dir) as entries:
+                for entry in entries:
+                    # check the extension on the entry's name so that non-media files
+                    # (which are most of the entries in some directories) are skipped
+                    # without creating a Path for them
+                    if os.path.splitext(entry.name)[1].casefold() in MEDIA_EXTS:
+                        yield pathlib.Path(entry.path)
+                    elif scan_subdirs and entry.is_dir():
+                        dirs.append((entry.path, False))
+
+
+async def transcribe_async(path: pathlib.Path, semaphore: asyncio.Semaphore, **kwargs):
+    async with semaphore:
+        # run in a thread so that one file's ffmpeg conversion and annotations
+        # update overlap with the transcription of another file
+        await asyncio.to_thread(transcribe, path, **kwargs)
+
+
+async def transcribe_all(paths: Iterable[pathlib.Path], jobs: int = 2, **kwargs):
+    semaphore = asyncio.Semaphore(jobs)
+    await asyncio.gather(
+        *(transcribe_async(path, semaphore, **kwargs) for path in paths)
+    )
+
+
+def route_file(*paths: pathlib.Path, scan_dir: bool = True, jobs: int = 2, **kwargs):
+    if kwargs.get("backend") == "faster-whisper":
+        import ctranslate2
+
+        # faster-whisper loads the model on every GPU, so work on at least 1 file per
+        # GPU at a time so that none of them are idle
+        jobs = max(jobs, ctranslate2.get_cuda_device_count())
+    asyncio.run(transcribe_all(find_files(*paths, scan_dir=scan_dir), jobs, **kwargs))
 
 
 def run_from_pipeline(args):
     paths = util.expand_files(args.pop("path"), to_paths=True)
-    route_file(*paths, **args)
+    # model might be passed as a str, so convert it so that transcribe can tell
+    # whether it's the whisper.cpp default
+    args["model"] = pathlib.Path(args.get("model", BASE_MODEL))
+    # model is also passed on to transcribe since faster-whisper doesn't use the daemon
+    with WhisperDaemon(args["model"]) as daemon:
+        route_file(*paths, daemon=daemon, **args)
+
+
+def get_output_paths(
+    path: pathlib.Path,
+) -> tuple[pathlib.Path, pathlib.Path, pathlib.Path]:
+    """Gets the paths of the files that transcribing `path` outputs to.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The absolute path to an audio or video file in data/audio or data/video.
+
+    Returns
+    -------
+    parent_dir : pathlib.Path
+        The directory containing `path` relative to data/audio or data/video.
+    transcription_path : pathlib.Path
+        The path to output the transcription to.
+    annotations_path : pathlib.Path
+        The path of the annotations file to add the words to.
+
+    Raises
+    ------
+    ValueError
+        If `path` isn't in data/audio or data/video.
+    """
+    parent = str(path.parent)
+    for root in _MEDIA_ROOTS:
+        # comparing strings is cheaper than Path.relative_to
+        if parent == root or parent.startswith(root + os.sep):
+            parent_dir = pathlib.Path(parent[len(root) + 1 :])
+            break
+    else:
+        raise ValueError("Input file must be a descendant of data/audio or data/video.")
+    transcription_path = (
+        TRANSCRIPTIONS_DIR / parent_dir / f"{path.stem}-transcription.json"
+    )
+    annotations_path = ANNOTATIONS_DIR / parent_dir / f"{path.stem}-annotations.json"
+    return parent_dir, transcription_path, annotations_path
+
+
+def read_transcription(path: pathlib.Path) -> Iterator[dict]:
+    """Reads the words from a transcription file output by transcribe.cpp."""
+    with open(path, "rb") as transc_file:
+        # the transcription is a flat array of words, so stream them with ijson
+        # (if it's installed) instead of loading the whole array into memory first
+        if ijson is not None:
+            yield from ijson.items(transc_file, "item", use_float=True)
+        else:
+            yield from orjson.loads(transc_file.read())
+
+
+# cached so that the directories are only created once instead of once per file
+@functools.lru_cache(maxsize=None)
+def _mkdir(dir: pathlib.Path):
+    dir.mkdir(exist_ok=True, parents=True)
+
+
+def _transcribe_piped(
+    ffmpeg_args: list, model: pathlib.Path, max_len: int, output_path: pathlib.Path
+):
+    ffmpeg_process = subprocess.Popen(
+        ffmpeg_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        log.run_and_log_subprocess(
+            [
+                TRANSCRIBE_SCRIPT,
+                "-m",
+                model,
+                "-ml",
+                str(max_len),
+                "-i",
+                "-",
+                "-o",
+                output_path,
+            ],
+            stdin=ffmpeg_process.stdout,
+        )
+    finally:
+        # close our copy of the pipe so ffmpeg gets SIGPIPE if transcribe exited early
+        ffmpeg_process.stdout.close()  # type: ignore
+        ffmpeg_stderr = ffmpeg_process.stderr.read()  # type: ignore
+        ffmpeg_process.wait()
+    if ffmpeg_process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            ffmpeg_process.returncode, ffmpeg_args, stderr=ffmpeg_stderr
+        )
 
 
 @log.Timer()
@@ -77,25 +287,14 @@ def transcribe(
     model: pathlib.Path = BASE_MODEL,
     max_len: int = 1,
     reprocess: bool = False,
+    backend: str = "whisper.cpp",
+    daemon: WhisperDaemon | None = None,
 ):
     log.log_vars(log_separate_=True, path=path, model=model)
-    log.log_vars(max_len=max_len, reprocess=reprocess)
+    log.log_vars(max_len=max_len, reprocess=reprocess, backend=backend)
 
-    try:
-        if "audio" in path.parts:
-            parent_dir = path.parent.relative_to(DATA_DIR / "audio")
-        elif "video" in path.parts:
-            parent_dir = path.parent.relative_to(DATA_DIR / "video")
-        else:
-            raise ValueError()
-    except ValueError:
-        raise ValueError("Input file must be a descendant of data/audio or data/video.")
-
-    transcriptions_dir = DATA_DIR / "transcriptions"
-    transcription_path = (
-        transcriptions_dir / parent_dir / f"{path.stem}-transcription.json"
-    )
-    transcription_path.parent.mkdir(exist_ok=True, parents=True)
+    parent_dir, transcription_path, annotations_path = get_output_paths(path)
+    _mkdir(transcription_path.parent)
 
     log.log_vars(
         log_separate_=True,
@@ -109,47 +308,44 @@ def transcribe(
         )
         return
 
-    converted_path = path.parent / f"{path.stem}-pcm_s16le.wav"
-    util.ffmpeg(
-        path,
-        converted_path,
-        output_options=["-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le"],
-    )
-
-    log.run_and_log_subprocess(
-        [
-            TRANSCRIBE_SCRIPT,
-            "-m",
-            model,
-            "-ml",
-            str(max_len),
-            "-i",
-            converted_path,
-            "-o",
-            transcription_path,
-        ]
-    )
-
-    # want to grab what transcribe.cpp output
-    # and add it to annotations
-    annotations_path = (
-        DATA_DIR / "annotations" / parent_dir / f"{path.stem}-annotations.json"
-    )
-    annotations_path.parent.mkdir(exist_ok=True, parents=True)
-
-    # open the transcription file to copy it over to annotations file
-    with open(transcription_path, "r") as transc_file:
-        transcription_output = json.load(transc_file)
-
-    all_words = []
-
-    point = 0
-
-    for obj in transcription_output:
-        label = obj["labelText"]
-        time = obj["time"]
-        all_words.append(format_word(f"point.{point}", label, time))
-        point += 1
+    if backend == "faster-whisper":
+        # imported here so that faster-whisper is only required when it's used
+        import transcribe_fw
+
+        # BASE_MODEL is a whisper.cpp model, so use faster-whisper's default instead
+        fw_model = transcribe_fw.DEFAULT_MODEL if model == BASE_MODEL else model
+        # faster-whisper returns the words, so they don't need to be read back in
+        words = transcribe_fw.transcribe(path, transcription_path, model=fw_model)
+    else:
+        # send the converted audio from ffmpeg's stdout to transcribe's stdin (either
+        # to the daemon or to a new process) instead of writing a temporary WAV file
+        ffmpeg_args = ["ffmpeg", "-loglevel", "error", "-i", path]
+        ffmpeg_args.extend(["-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le"])
+        ffmpeg_args.extend(["-f", "wav", "-"])
+        logger.debug("Running subprocess: {}", ffmpeg_args)
+        if daemon is not None:
+            wav_data = subprocess.run(
+                ffmpeg_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+            ).stdout
+            daemon.transcribe(wav_data, transcription_path)
+        else:
+            _transcribe_piped(ffmpeg_args, model, max_len, transcription_path)
+        # want to grab what transcribe.cpp output and add it to annotations
+        words = read_transcription(transcription_path)
+
+    _mkdir(annotations_path.parent)
+
+    # build the Word items directly instead of calling format_word for every word
+    # since this is the same as format_word without the extra function calls
+    all_words = [
+        {
+            "type": "Word",
+            "arguments": [
+                {"id": f"point.{i}", "labelText": obj["labelText"], "time": obj["time"]}
+            ],
+        }
+        for i, obj in enumerate(words)
+    ]
 
     words_options = {
         "parent": "Analysis",
@@ -157,30 +353,31 @@ def transcribe(
     }
     word_group = format_peaks_group("Words", words_options)
 
-    with open(annotations_path, "r") as annot_file:
-        annot_data = json.load(annot_file)
-
-    annotations = annot_data.get("annotations", [])
+    # open once for both reading and writing instead of opening the file twice
+    with open(annotations_path, "r+b") as annot_file:
+        annot_data = orjson.loads(annot_file.read())
 
-    found = False
+        annotations = annot_data.get("annotations", [])
 
-    for index, element in enumerate(annotations):
-        if element.get("arguments") == ["Words"]:
-            # replace previous words
-            annotations[index] = word_group
-            found = True
-            break
-    if not found:
-        # add words for first time
-        annotations.append(word_group)
+        for index, element in enumerate(annotations):
+            # check the first argument instead of comparing against a new list
+            arguments = element.get("arguments")
+            if arguments and arguments[0] == "Words":
+                # replace previous words
+                annotations[index] = word_group
+                break
+        else:
+            # add words for first time
+            annotations.append(word_group)
 
-    annot_data["annotations"] = annotations
+        annot_data["annotations"] = annotations
 
-    with open(annotations_path, "w") as file:
-        json.dump(annot_data, file)
+        annot_file.seek(0)
+        annot_file.write(orjson.dumps(annot_data))
+        # the new data might be shorter than the old data
+        annot_file.truncate()
 
     logger.info("Transcription saved to {}", transcription_path)
-    converted_path.unlink()
 
 
 if __name__ == "__main__":
@@ -210,6 +407,27 @@ if __name__ == "__main__":
     #         " maximum, and using 1 (the default) will give you word-level timestamps."
     #     ),
     # )
+    parser.add_argument(
+        "-b",
+        "--backend",
+        choices=["whisper.cpp", "faster-whisper"],
+        default="whisper.cpp",
+        help=(
+            "The speech recognition backend to use. faster-whisper runs batched"
+            " inference on the GPU if one is available. Default is whisper.cpp."
+        ),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=2,
+        help=(
+            "The number of files to work on at once. Files are still transcribed one"
+            " at a time, but converting the next files overlaps with transcribing."
+            " Default is 2."
+        ),
+    )
     parser.add_argument(
         "-r",
         "--reprocess",
@@ -221,4 +439,7 @@ if __name__ == "__main__":
     args = vars(parser.parse_args())
     log.setup_logging(args.pop("log_level"))
     with log.Timer("Transcribing took {}"):
-        route_file(*args.pop("path"), **args)
+        # model is also passed on to transcribe since faster-whisper doesn't use the
+        # daemon
+        with WhisperDaemon(args["model"]) as daemon:
+            route_file(*args.pop("path"), daemon=daemon, **args)
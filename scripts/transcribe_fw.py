@@ -0,0 +1,100 @@
+import functools
+import pathlib
+import threading
+
+import ctranslate2
+import orjson
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+
+from log import logger
+
+DEFAULT_MODEL = "base.en"
+BATCH_SIZE = 16
+
+# transcribe.py transcribes files in multiple threads, so this makes sure the first
+# threads don't all load the model at the same time
+_model_lock = threading.Lock()
+
+
+def get_model(model: str | pathlib.Path = DEFAULT_MODEL) -> BatchedInferencePipeline:
+    """Loads a faster-whisper model, caching it so it's only loaded once.
+
+    See Also
+    --------
+    _load_model : Load a faster-whisper model.
+    """
+    with _model_lock:
+        return _load_model(model)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_model(model: str | pathlib.Path = DEFAULT_MODEL) -> BatchedInferencePipeline:
+    """Loads a faster-whisper model.
+
+    Parameters
+    ----------
+    model : str or pathlib.Path, default=DEFAULT_MODEL
+        The size of the model (e.g. "base.en") or the path to a converted model.
+
+    Returns
+    -------
+    faster_whisper.BatchedInferencePipeline
+        A pipeline that transcribes batches of voice-activity-detected segments.
+    """
+    num_gpus = ctranslate2.get_cuda_device_count()
+    if num_gpus > 0:
+        # load a replica on every GPU. CTranslate2 sends concurrent calls to
+        # whichever replica is free, so transcribing in multiple threads uses all GPUs
+        device, device_index, compute_type = "cuda", list(range(num_gpus)), "float16"
+    else:
+        device, device_index, compute_type = "cpu", 0, "int8"
+    logger.debug(
+        "Loading faster-whisper model {} on {} {}", model, device, device_index
+    )
+    whisper_model = WhisperModel(
+        str(model),
+        device=device,
+        device_index=device_index,
+        compute_type=compute_type,
+    )
+    return BatchedInferencePipeline(model=whisper_model)
+
+
+def transcribe(
+    path: pathlib.Path,
+    output_path: pathlib.Path,
+    model: str | pathlib.Path = DEFAULT_MODEL,
+    batch_size: int = BATCH_SIZE,
+) -> list[dict]:
+    """Transcribes the audio in `path` and writes the words to `output_path`.
+
+    The words are written in the same format that transcribe.cpp outputs (an array
+    of {"labelText", "time"} objects) so the rest of transcribe.py works the same
+    regardless of which backend is used.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The audio or video file to transcribe.
+    output_path : pathlib.Path
+        The path to write the transcription JSON to.
+    model : str or pathlib.Path, default=DEFAULT_MODEL
+        The size of the model (e.g. "base.en") or the path to a converted model.
+    batch_size : int, default=BATCH_SIZE
+        The number of segments to run through the model at once.
+
+    Returns
+    -------
+    list of dict
+        The words that were written to `output_path`.
+    """
+    segments, _ = get_model(model).transcribe(
+        str(path), batch_size=batch_size, word_timestamps=True
+    )
+    words = [
+        {"labelText": word.word.strip(), "time": word.start}
+        for segment in segments
+        for word in segment.words
+    ]
+    output_path.write_bytes(orjson.dumps(words))
+    return words
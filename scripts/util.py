@@ -1,12 +1,18 @@
 # annotations removes the need to put quotes around types that are undefined at runtime
 from __future__ import annotations
 
+import bisect
 import csv
+import functools
 import glob
+import io
 import itertools
+import math
+import os
 import random
 import re
 import subprocess
+import types
 from collections.abc import Iterable, Iterator, Mapping
 from enum import Enum
 from operator import itemgetter
@@ -34,6 +40,9 @@ from _types import (
 )
 from log import run_and_log_subprocess
 
+# bound once since _load_json_value calls it for every string in recurse_load_json
+_json_loads = json.loads
+
 T = TypeVar("T")  #: Generic type variable.
 U = TypeVar("U")  #: Generic type variable.
 K = TypeVar("K")  #: Generic type variable for keys in a mapping.
@@ -85,13 +94,32 @@ def split_path_at(
     >>> split_path_at(audio_path, "data", inclusive=False)
     (PosixPath('/home/user/speechviz'), PosixPath('audio/example.wav'))
     """
-    path = Path(path)
-    for parent in path.parents:
-        if parent.name == part:
+    # Paths are immutable, so the cached tuple can be returned as is
+    return _split_path_at(os.fspath(path), part, inclusive)
+
+
+@functools.lru_cache(maxsize=4096)
+def _split_path_at(path: str, part: str, inclusive: bool) -> tuple[Path, Path]:
+    path_obj = Path(path)
+    if not part:
+        # the only parent with an empty name is the root (or "." for relative paths),
+        # which isn't in parts, so this one case has to check the parents
+        for parent in path_obj.parents:
+            if parent.name == part:
+                return parent, path_obj.relative_to(parent)
+        raise ValueError(f"{part} is not in the path {path}")
+
+    parts = path_obj.parts
+    # Search from the end so that the last occurrence of part is split at. The last
+    # part is skipped because it's the file / directory itself, not a parent, and the
+    # anchor (e.g., "/") is skipped because it isn't a name
+    stop = 0 if path_obj.anchor else -1
+    for i in range(len(parts) - 2, stop, -1):
+        if parts[i] == part:
             if inclusive:
-                return parent, path.relative_to(parent.parent)
+                return Path(*parts[: i + 1]), Path(*parts[i:])
             else:
-                return parent.parent, path.relative_to(parent)
+                return Path(*parts[:i]), Path(*parts[i + 1 :])
     raise ValueError(f"{part} is not in the path {path}")
 
 
@@ -189,8 +217,9 @@ def expand_files(
     ----------
     files : str or list of str
     wildcard : bool, default=False
-        Whether any of the file paths contain a wildcard ("*")
-        that needs to be expanded.
+        Whether any of the file paths contain a wildcard ("*") that needs to be
+        expanded. "**" matches files in the directory and all of its subdirectories.
+        Files matched by more than one of the paths are only yielded once.
     to_paths : bool, default=False
         Whether each file in the expanded files should be converted to `pathlib.Path`.
 
@@ -205,14 +234,55 @@ def expand_files(
     if isinstance(files, str) or not isinstance(files, Iterable):
         files = [files]
     if wildcard:
-        # convert to str because glob doesn't work on Path
-        files = flatten([glob.glob(str(file)) for file in files])
+        files = _expand_wildcards(files)
     if to_paths:
-        # map is an iterator so no need to do `yield from`
-        files = map(Path, files)
+        if wildcard:
+            # glob matches usually share directories, so reuse their parent Paths
+            files = _paths_with_shared_parents(files)
+        else:
+            # map is an iterator so no need to do `yield from`
+            files = map(Path, files)
     yield from files
 
 
+def _paths_with_shared_parents(files: Iterable[str]) -> Iterator[Path]:
+    # Joining a name onto an already parsed parent is faster than parsing the whole
+    # path again for every file in the same directory
+    parents: dict[str, Path] = {}
+    for file in files:
+        dirname, name = os.path.split(file)
+        parent = parents.get(dirname)
+        if parent is None:
+            parent = parents[dirname] = Path(dirname)
+        yield parent / name
+
+
+_has_wildcard = re.compile(r"[*?[]").search
+
+
+def _expand_wildcards(files: Iterable[StrPath]) -> Iterator[str]:
+    # Patterns can overlap (e.g., "*.wav" and "speaker_*.wav"), so keep track of the
+    # files that were already yielded so the same file isn't processed twice
+    seen: set[str] = set()
+    for file in files:
+        # convert to str because glob doesn't work on Path
+        file = str(file)
+        if _has_wildcard(file) is None:
+            # glob only yields a path without wildcards if it exists, so check that
+            # directly instead of going through glob
+            matches = (file,) if os.path.lexists(file) else ()
+        else:
+            # iglob streams the matches instead of building a list of them.
+            # recursive=True makes "**" match any number of directories
+            matches = glob.iglob(file, recursive=True)
+        for match in matches:
+            # normalize so that, e.g., "./a.wav" and "a.wav" are seen as the same file
+            key = os.path.normcase(os.path.normpath(match))
+            if key not in seen:
+                seen.add(key)
+                yield match
+
+
 def ffmpeg(
     input: StrOrBytesPath,
     output: StrOrBytesPath,
@@ -243,13 +313,19 @@ def ffmpeg(
     subprocess.CompletedProcess
         The completed process containing info about the `ffmpeg` command that was run.
     """
-    args: list[StrOrBytesPath] = ["ffmpeg", "-y"]
-    if input_options:
-        args.extend(input_options)
-    args.extend(["-i", input])
-    if output_options:
-        args.extend(output_options)
-    args.append(output)
+    # build the args in one list display instead of appending and extending
+    args: list[StrOrBytesPath] = [
+        "ffmpeg",
+        "-y",
+        # the progress stats are rewritten many times a second and aren't useful in
+        # the log, so don't output them
+        "-nostats",
+        *(input_options or ()),
+        "-i",
+        input,
+        *(output_options or ()),
+        output,
+    ]
     return run_and_log_subprocess(args, check=check)
 
 
@@ -289,35 +365,127 @@ def audiowaveform(
         f"-o{output}",
         "-b",
         "8",
+        *(("--split-channels",) if split_channels else ()),
+        *(options or ()),
     ]
-    if split_channels:
-        args.append("--split-channels")
-    if options:
-        args.extend(options)
     return run_and_log_subprocess(args, check=check)
 
 
+# the iterables that flatten can tell are iterable without checking the Iterable ABC
+_FLATTEN_TYPES = frozenset(
+    {
+        list,
+        tuple,
+        set,
+        frozenset,
+        types.GeneratorType,
+        map,
+        filter,
+        itertools.chain,
+        np.ndarray,
+    }
+)
+# the values that flatten can tell aren't iterable without checking the Iterable ABC.
+# Includes the NumPy scalars because extract_vrs_data flattens every record of the
+# sensor data's structured arrays
+_FLATTEN_LEAF_TYPES = frozenset(
+    {str, int, float, bool, type(None)}
+    | {np.dtype(char).type for char in np.typecodes["All"] if char not in "OSUV"}
+)
+
+
 # functions that yield have return type Iterator (not Iterable)
 def flatten(arr: Iterable[Nested[T]]) -> Iterator[T]:
-    for val in arr:
-        if isinstance(val, Iterable) and not isinstance(val, str):
-            yield from flatten(val)
-        else:
+    # Use a stack of iterators instead of recursing so that there isn't a generator
+    # (and a yield from) for every nested iterable
+    stack = [iter(arr)]
+    while stack:
+        for val in stack[-1]:
+            # Looking up the exact type in a set of the common containers is much
+            # faster than checking the Iterable ABC. str is checked before the ABC
+            # because str is Iterable and we don't want to flatten str (and since str
+            # leaves are common, this also skips the ABC check for them).
+            cls = type(val)
+            if cls in _FLATTEN_TYPES or (
+                cls not in _FLATTEN_LEAF_TYPES
+                and isinstance(val, Iterable)
+                and not isinstance(val, str)  # str subclasses
+            ):
+                stack.append(iter(val))
+                break  # continue with the nested iterable's items
             # Pyright complains about val's type here. I'm pretty sure it's because of
-            # weird type narrowing because of the check for str above, but the check is
-            # necessary because str is Iterable and we don't want to flatten str.
+            # weird type narrowing because of the check for str above.
             yield val  # type: ignore
+        else:  # the iterator on top of the stack is exhausted
+            stack.pop()
 
 
-# https://stackoverflow.com/a/26026189
+@overload
 def get_nearest_index(array: Sequence[NumberT], value: NumberT) -> SupportsIndex:
+    ...
+
+
+@overload
+def get_nearest_index(
+    array: Sequence[NumberT], value: Sequence[NumberT] | NDArray
+) -> NDArray[np.intp]:
+    ...
+
+
+# https://stackoverflow.com/a/26026189
+def get_nearest_index(array, value):
+    """Gets the index of the value in a sorted array nearest to the given value.
+
+    Parameters
+    ----------
+    array : sequence of numbers
+        The sorted array to search.
+    value : number or sequence of numbers
+        The value to find the nearest index of. If this is a sequence, the nearest
+        index of each value is found at once.
+
+    Returns
+    -------
+    int or numpy.ndarray
+        The index of the nearest value, or an array of the nearest indices if
+        `value` is a sequence. If `array` is empty, the index is 0.
+
+    Examples
+    --------
+    >>> get_nearest_index([1, 2, 4, 8], 3.5)
+    2
+    >>> get_nearest_index([1, 2, 4, 8], [0, 3.5, 7, 10])
+    array([0, 2, 3, 3])
+    """
+    if len(array) == 0:
+        # there's nothing to index, so keep returning 0 like searchsorted gives
+        shape = np.shape(value)
+        return 0 if shape == () else np.zeros(shape, dtype=np.intp)
+    # Finding a single value is much faster with plain Python comparisons than with
+    # NumPy's vectorized ones. NaN is left to searchsorted since bisect can't sort it
+    if isinstance(value, (int, float)) and not math.isnan(value):
+        if isinstance(array, np.ndarray):
+            i = int(array.searchsorted(value))
+        else:
+            i = bisect.bisect_left(array, value)
+        if i == 0:
+            return 0
+        if i == len(array):
+            return i - 1
+        return i - 1 if abs(value - array[i - 1]) < abs(value - array[i]) else i
+
+    array = np.asarray(array)
+    value = np.asarray(value)
     i = np.searchsorted(array, value)
-    if i > 0 and (
-        i == len(array) or np.abs(value - array[i - 1]) < np.abs(value - array[i])
-    ):
-        return i - 1
-    else:
-        return i
+    # clip the indices so that they can be used to index array. right is the index of
+    # the first value >= value and left is the index of the last value < value
+    right = np.minimum(i, len(array) - 1)
+    left = np.maximum(i - 1, 0)
+    use_left = (i > 0) & (
+        (i == len(array)) | (np.abs(value - array[left]) < np.abs(value - array[right]))
+    )
+    nearest = np.where(use_left, left, right)
+    return nearest.item() if nearest.ndim == 0 else nearest
 
 
 # https://stackoverflow.com/a/5389547
@@ -332,6 +500,10 @@ def grouped(iterable: Iterable[T], n: int) -> Iterator[tuple[T, ...]]:
 
     Returns
     -------
+    Iterator of tuple
+        The groups of `n` elements. If the number of elements isn't a multiple of `n`,
+        the leftover elements at the end are dropped (unlike `itertools.batched`,
+        which yields them as a shorter last group).
 
     Examples
     --------
@@ -342,6 +514,9 @@ def grouped(iterable: Iterable[T], n: int) -> Iterator[tuple[T, ...]]:
     return zip(*([iter(iterable)] * n))
 
 
+_HEX_BYTES = [f"{i:02x}" for i in range(256)]
+
+
 def random_color_generator(seed: int | None = None) -> Iterator[str]:
     """Indefinitely generates random colors as hexadecimal strings.
 
@@ -356,24 +531,60 @@ def random_color_generator(seed: int | None = None) -> Iterator[str]:
         A hex color string in the form "#RRGGBB".
     """
     rng = random.Random(seed)  # Random instance because we don't want to share context
+    # bind to locals since they're used every iteration
+    getrandbits = rng.getrandbits
+    hex_bytes = _HEX_BYTES
     while True:  # while True because this is an infinite generator
-        r = rng.randrange(255)
-        g = rng.randrange(255)
-        b = rng.randrange(255)
-        yield f"#{r:02x}{g:02x}{b:02x}"
+        # draw all 3 bytes at once (0-255 each) instead of calling randrange 3 times
+        rgb = getrandbits(24)
+        r, g, b = rgb >> 16, (rgb >> 8) & 0xFF, rgb & 0xFF
+        yield f"#{hex_bytes[r]}{hex_bytes[g]}{hex_bytes[b]}"
 
 
 def sort_and_regroup(lists: Sequence2D[T], key: KeyFunc[T] | None = None) -> List2D[T]:
-    flat = [(item, i) for i in range(len(lists)) for item in lists[i]]
+    """Sorts the items of all of the lists together and groups consecutive items that
+    came from the same list.
 
+    Note that a list can be split into multiple groups if items from other lists are
+    sorted between its items, so the result isn't one group per list.
+
+    Parameters
+    ----------
+    lists : sequence of sequences
+        The lists whose items to sort.
+    key : callable, optional
+        The function to get the key to sort each item by. If not given, the items
+        themselves are compared.
+
+    Returns
+    -------
+    list of lists
+        The runs of sorted items that came from the same list.
+
+    Examples
+    --------
+    >>> sort_and_regroup([[1, 2, 6], [3, 4], [5]])
+    [[1, 2], [3, 4], [5], [6]]
+    """
+    # Compute each item's key once up front instead of wrapping key in a lambda that
+    # is called for every item during the sort
     if key is None:
-        key_on_first_item = itemgetter(0)
+        flat = [(item, i, item) for i, lst in enumerate(lists) for item in lst]
     else:
-        key_on_first_item = lambda item: key(item[0])  # noqa: E731
-
-    flat.sort(key=key_on_first_item)
-    grouped = itertools.groupby(flat, key=itemgetter(1))
-    return [[item[0] for item in list(g)] for _, g in grouped]
+        flat = [(key(item), i, item) for i, lst in enumerate(lists) for item in lst]
+
+    # sort is stable, so items with equal keys stay in the order of lists
+    flat.sort(key=itemgetter(0))
+    regrouped: List2D[T] = []
+    prev_i = -1
+    for _, i, item in flat:
+        # start a new group whenever the item came from a different list than the last
+        if i != prev_i:
+            group = []
+            regrouped.append(group)
+            prev_i = i
+        group.append(item)
+    return regrouped
 
 
 class AggregateData:
@@ -381,21 +592,30 @@ class AggregateData:
         # data = np.asarray(data)
         self.data = data
 
+        values = np.asarray(data)
         # The nan-versions ignore nans but throws an error if all values are nan, so
-        # we exclude that case.
-        if ignore_nan and not np.isnan(data).all():
-            self.mean = np.nanmean(data, dtype=np.float64)
-            self.median = np.nanmedian(data)
-            self.std = np.nanstd(data, dtype=np.float64)
-            self.max = np.nanmax(data)
-            self.min = np.nanmin(data)
+        # we exclude that case. Rather than calling the nan-versions (which each
+        # find the nans again), the nans are removed once and the non-nan versions
+        # are used on what's left
+        if ignore_nan:
+            not_nan = ~np.isnan(values)
+            # only copy the non-nan values if there actually are nans to remove
+            if not_nan.any() and not not_nan.all():
+                values = values[not_nan]
         # The non-nan versions will return nan if there are any nans.
-        else:
-            self.mean = np.mean(data, dtype=np.float64)
-            self.median = np.median(data)
-            self.std = np.std(data, dtype=np.float64)
-            self.max = np.amax(data)
-            self.min = np.amin(data)
+        self._values = values
+        self.mean = np.mean(values, dtype=np.float64)
+        # np.std calculates the mean again, so reuse the mean. np.dot squares and sums
+        # the deviations in one pass without making another temporary array
+        deviations = np.subtract(values, self.mean, dtype=np.float64).ravel()
+        self.std = np.sqrt(np.dot(deviations, deviations) / deviations.size)
+        self.max = np.amax(values)
+        self.min = np.amin(values)
+
+    @functools.cached_property
+    def median(self):
+        # median needs to partially sort the data, so only calculate it when used
+        return np.median(self._values)
 
 
 @overload
@@ -442,30 +662,34 @@ def min_key(d: Mapping[K, V], *, default: T | _Missing = _missing) -> tuple[K, V
     """Returns the item from `d` with the minimum key."""
     if len(d) == 0 and default is not _missing:
         return default
-    # if len(d) == 0 and default is _missing, this'll throw error like we want
-    # itemgetter is faster than `lambda item: item[0]`
-    return min(d.items(), key=itemgetter(0))
+    # if len(d) == 0 and default is _missing, this'll throw error like we want.
+    # Comparing the keys directly avoids creating a tuple for every item
+    key = min(d)
+    return key, d[key]
 
 
 def max_key(d: Mapping[K, V], *, default: T | _Missing = _missing) -> tuple[K, V] | T:
     """Returns the item from `d` with the maximum key."""
     if len(d) == 0 and default is not _missing:
         return default
-    return max(d.items(), key=itemgetter(0))
+    key = max(d)
+    return key, d[key]
 
 
 def min_value(d: Mapping[K, V], *, default: T | _Missing = _missing) -> tuple[K, V] | T:
     """Returns the item from `d` with the minimum value."""
     if len(d) == 0 and default is not _missing:
         return default
-    return min(d.items(), key=itemgetter(1))
+    key = min(d, key=d.__getitem__)
+    return key, d[key]
 
 
 def max_value(d: Mapping[K, V], *, default: T | _Missing = _missing) -> tuple[K, V] | T:
     """Returns the item from `d` with the maximum value."""
     if len(d) == 0 and default is not _missing:
         return default
-    return max(d.items(), key=itemgetter(1))
+    key = max(d, key=d.__getitem__)
+    return key, d[key]
 
 
 def recurse_load_json(obj: str | dict | list) -> JSON:
@@ -489,17 +713,51 @@ def recurse_load_json(obj: str | dict | list) -> JSON:
     >>> load_json_str(json_str)
     {'key': {'nested_key': 'nested_value'}}
     """
-    # use try in case obj is a string that isn't valid JSON
-    try:
-        if isinstance(obj, str):
-            obj = json.loads(obj)
-        # the next ifs aren't elifs because we want to include obj loaded from str above
-        if isinstance(obj, dict):
-            obj = {key: recurse_load_json(obj[key]) for key in obj}
-        if isinstance(obj, list):
-            obj = [recurse_load_json(item) for item in obj]
-    finally:
-        return obj
+    obj = _load_json_value(obj)
+    # Instead of recursing, keep a stack of the dicts and lists whose values still need
+    # to be loaded. The containers on the stack are copies (or were just loaded from a
+    # string), so they can be updated in place without modifying the original obj
+    stack: list[dict | list] = []
+    if isinstance(obj, (dict, list)):
+        obj = _copy_container(obj)
+        stack.append(obj)
+    while stack:
+        container = stack.pop()
+        items = (
+            container.items() if isinstance(container, dict) else enumerate(container)
+        )
+        for key, val in items:
+            new_val = _load_json_value(val)
+            if isinstance(new_val, (dict, list)):
+                # only copy the containers that were already in obj
+                if new_val is val:
+                    new_val = _copy_container(val)
+                stack.append(new_val)
+            if new_val is not val:
+                # replacing the value of an existing key is safe while iterating
+                container[key] = new_val  # type: ignore
+    return obj
+
+
+# The characters that a JSON document can start with. NaN and Infinity aren't valid
+# JSON, but json (which is used when orjson isn't installed) loads them
+_JSON_START_CHARS = frozenset('{["-0123456789tfnNI \t\n\r')
+
+
+def _load_json_value(val):
+    """Loads `val` if it's a string containing valid JSON and returns it otherwise."""
+    # Strings that can't be JSON are skipped without trying to load them because
+    # raising and catching the decode error is much slower than checking a character
+    if isinstance(val, str) and val[:1] in _JSON_START_CHARS:
+        try:
+            return _json_loads(val)
+        except ValueError:  # the JSONDecodeErrors of json and orjson are ValueErrors
+            pass
+    return val
+
+
+def _copy_container(container: dict | list) -> dict | list:
+    return dict(container) if isinstance(container, dict) else list(container)
 
 
 def add_to_csv(path: Path, data: dict, remove_keys: list | None = None):
@@ -523,23 +781,33 @@ def add_to_csv(path: Path, data: dict, remove_keys: list | None = None):
     """
     if path.exists():
         with path.open(newline="") as file:
-            reader = csv.DictReader(file)
-            try:
-                read_data = next(reader)
-            except StopIteration:
-                read_data = {}  # empty file
-        if remove_keys is not None:
-            for key in remove_keys:
-                if isinstance(key, str):
-                    read_data.pop(key, None)
-                elif isinstance(key, re.Pattern):
-                    for k in list(read_data.keys()):
-                        if key.match(k):
-                            read_data.pop(k, None)
+            # There's only 1 row, so zip it with the fieldnames instead of having
+            # DictReader build a dict for it. Blank lines are skipped like DictReader
+            # does, and an empty file gives an empty dict
+            reader = csv.reader(file)
+            fieldnames = next(reader, [])
+            row = next((row for row in reader if row), [])
+            read_data = dict(zip(fieldnames, row))
+        if remove_keys:
+            # split the keys by type once so that each field is only checked once
+            remove_strs = {key for key in remove_keys if isinstance(key, str)}
+            patterns = [key for key in remove_keys if isinstance(key, re.Pattern)]
+            read_data = {
+                k: v
+                for k, v in read_data.items()
+                if k not in remove_strs and not any(p.match(k) for p in patterns)
+            }
         read_data.update(data)
         data = read_data
-    fieldnames = list(data.keys())
-    with path.open("w", newline="") as file:
-        writer = csv.DictWriter(file, fieldnames)
-        writer.writeheader()
-        writer.writerow(data)
+    # The header and the row are written to a buffer first so that the file is written
+    # with a single write. The fieldnames are data's keys, so the row is just its values
+    buffer = io.StringIO(newline="")
+    writer = csv.writer(buffer)
+    writer.writerow(data.keys())
+    writer.writerow(data.values())
+    # write to a temporary file and then replace the CSV with it so that the CSV is
+    # never left partially written
+    temp_path = path.with_name(f".{path.name}.tmp")
+    with temp_path.open("w", newline="") as file:
+        file.write(buffer.getvalue())
+    os.replace(temp_path, path)
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import concurrent.futures
+import functools
 import json
+import operator
 import os
 import tempfile
+from collections import deque
 from collections.abc import Callable, Iterable, Iterator, Mapping
 from dataclasses import dataclass
 from typing import NamedTuple
@@ -120,9 +124,29 @@ class VrsVideoClip(ImageSequenceClip):
         deliver_queue = dp.deliver_queued_sensor_data(deliver_queue_options)
 
         fps = int(dp.get_nominal_rate_hz(stream_id))
-        frames = list(map(self._frame, deliver_queue))
-
-        super().__init__(frames, fps=fps)
+        # Holding every decoded frame in memory takes tens of GB for long recordings,
+        # so the frames are written to a temporary folder and ImageSequenceClip reads
+        # each one back only when it's needed
+        self._temp_folder = tempfile.TemporaryDirectory()
+        frame_paths = []
+        # Encoding the PNGs takes much longer than decoding the frames, and cv2
+        # releases the GIL while it encodes, so the frames are written in a thread
+        # pool. Only a few frames are queued at a time so that they don't pile up
+        # in memory when decoding gets ahead of the writers
+        num_workers = os.cpu_count() or 1
+        pending: deque[concurrent.futures.Future] = deque()
+        with concurrent.futures.ThreadPoolExecutor(num_workers) as executor:
+            for i, sensor_data in enumerate(deliver_queue):
+                if len(pending) >= 2 * num_workers:
+                    pending.popleft().result()  # raises the exception if writing failed
+                frame_fspath = os.path.join(self._temp_folder.name, f"{i:08d}.png")
+                frame = self._bgr_frame(sensor_data)
+                pending.append(executor.submit(_write_png, frame_fspath, frame))
+                frame_paths.append(frame_fspath)
+            for future in pending:
+                future.result()
+
+        super().__init__(frame_paths, fps=fps)
 
         if audio:
             try:
@@ -130,12 +154,23 @@ class VrsVideoClip(ImageSequenceClip):
             except Exception:
                 pass  # ignore if audio extraction fails
 
-    def _frame(self, sensor_data: SensorData) -> np.ndarray:
+    def _bgr_frame(self, sensor_data: SensorData) -> np.ndarray:
         img = sensor_data.image_data_and_record()[0].to_numpy_array()
-        if img.ndim == 2:
-            # Convert grayscale image to RGB since moviepy requires RGB images
-            return cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
-        return img.copy()
+        # moviepy requires RGB images, so grayscale images are converted. cv2 writes
+        # images in BGR order, so RGB images are swapped to be read back as RGB.
+        # cvtColor also copies the image out of the record's buffer
+        code = cv2.COLOR_GRAY2BGR if img.ndim == 2 else cv2.COLOR_RGB2BGR
+        return cv2.cvtColor(img, code)
+
+    def close(self):
+        super().close()
+        self._temp_folder.cleanup()
+
+
+def _write_png(fspath: str, img: np.ndarray):
+    # low compression since the frames are only kept until the clip is closed
+    if not cv2.imwrite(fspath, img, [cv2.IMWRITE_PNG_COMPRESSION, 1]):
+        raise OSError(f"Failed to write frame to {fspath}")
 
 
 class UndistortVrsVideoTransform:
@@ -217,17 +252,47 @@ class UndistortVrsVideoTransform:
         self._linear = calibration.get_linear_camera_calibration(
             width, height, focal_length, stream_label, transform
         )
+        # distort_by_calibration recomputes where every pixel comes from for every
+        # frame, but the calibrations never change, so compute it once and remap
+        self._map_x, self._map_y = self._remap_tables(width, height)
+
+    def _remap_tables(self, width: int, height: int) -> tuple[np.ndarray, np.ndarray]:
+        """Computes the pixel of the distorted image that each undistorted pixel is
+        sampled from, the same way `calibration.distort_by_calibration` does.
+
+        Pixels that aren't visible in the distorted image are mapped to -1, which
+        `cv2.remap` fills with black. If the transform rotates, the tables are
+        rotated so that `cv2.remap` also does the rotation.
+        """
+        map_x = np.full((height, width), -1, dtype=np.float32)
+        map_y = np.full((height, width), -1, dtype=np.float32)
+        unproject = self._linear.unproject_no_checks
+        project = self._calib.project
+        pixel = np.empty(2, dtype=np.float64)
+        for y in range(height):
+            pixel[1] = y
+            for x in range(width):
+                pixel[0] = x
+                distorted_pixel = project(unproject(pixel))
+                if distorted_pixel is not None:
+                    map_x[y, x], map_y[y, x] = distorted_pixel
+        if self._rotate:
+            map_x = np.ascontiguousarray(np.rot90(map_x, -1))
+            map_y = np.ascontiguousarray(np.rot90(map_y, -1))
+        return map_x, map_y
 
     def __call__(
         self, get_frame: Callable[[float], np.ndarray], t: float
     ) -> np.ndarray:
         frame = get_frame(t)
-        undistorted = calibration.distort_by_calibration(
-            frame, self._linear, self._calib
+        return cv2.remap(
+            frame,
+            self._map_x,
+            self._map_y,
+            cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_CONSTANT,
+            borderValue=0,
         )
-        if self._rotate:
-            return np.rot90(undistorted, -1)
-        return undistorted
 
 
 class Property(NamedTuple):
@@ -252,6 +317,14 @@ float64_3d = np.dtype((np.float64, (3,)))
 TIMESTAMP_PROPERTY = Property("capture_timestamp_ns", np.int64)
 
 
+# dtypes are immutable and only depend on the properties, so each one is only created
+# once instead of every time a stream's array is created
+@functools.cache
+def _create_dtype(properties: tuple[Property, ...]) -> np.dtype:
+    # remember that each property is just a tuple of (name, dtype)
+    return np.dtype(list(properties))
+
+
 @dataclass(order=False, frozen=True, slots=True)
 class StreamInfo:
     id: str
@@ -267,8 +340,7 @@ class StreamInfo:
         return cls(id, name, tuple(props))
 
     def create_dtype(self) -> np.dtype:
-        # remember that each property is just a tuple of (name, dtype)
-        return np.dtype(list(self.properties))
+        return _create_dtype(self.properties)
 
     def without(self, *names: str) -> StreamInfo:
         return StreamInfo(
@@ -371,14 +443,44 @@ def generate_sensor_data(
 
 
 def first_time_ns(dp: VrsDataProvider, time_domain: TimeDomain = _DEVICE_TIME) -> int:
-    # We only use the first time from some streams because for some reason 231-1
-    # (the microphones) sometimes have a way earlier first time (and all of its
-    # records are at the same time) than the other streams
-    return min(
-        dp.get_first_time_ns(s_id, time_domain)
-        for s_id in get_active_streams(dp)
-        if str(s_id) != "231-1"
-    )
+    # This finds the active streams itself instead of calling get_active_streams so
+    # that each stream's first time is only gotten once when time_domain is the device
+    # time (which get_active_streams checks)
+    first_times = []
+    for s_id in dp.get_all_streams():
+        # We only use the first time from some streams because for some reason 231-1
+        # (the microphones) sometimes have a way earlier first time (and all of its
+        # records are at the same time) than the other streams
+        if str(s_id) == "231-1":
+            continue
+        first_time = dp.get_first_time_ns(s_id, _DEVICE_TIME)
+        if first_time == -1:  # the stream isn't active
+            continue
+        if time_domain != _DEVICE_TIME:
+            first_time = dp.get_first_time_ns(s_id, time_domain)
+        first_times.append(first_time)
+    return min(first_times)
+
+
+def _data_getter(dp: VrsDataProvider, s_id: StreamId) -> Callable[[SensorData], object]:
+    """Returns a function that gets a stream's data (e.g., `ImuData`) from a record."""
+    s_type = dp.get_sensor_data_type(s_id).name.lower()
+    if s_type == "image" or s_type == "audio":
+        get_data_and_record = operator.methodcaller(f"{s_type}_data_and_record")
+        return lambda s_data: get_data_and_record(s_data)[1]
+    return operator.methodcaller(f"{s_type}_data")
+
+
+def _fields_getter(names: tuple[str, ...]) -> Callable[[object], tuple]:
+    """Returns a function that gets all of the `names` fields as a tuple."""
+    # Getting all of a record's fields with one attrgetter call lets the record be
+    # written into its array with one assignment instead of one assignment per field.
+    # attrgetter only returns a tuple when it gets more than 1 field, so wrap the
+    # single field case
+    getter = operator.attrgetter(*names)
+    if len(names) == 1:
+        return lambda data: (getter(data),)
+    return getter
 
 
 def get_stream_data(
@@ -389,25 +491,20 @@ def get_stream_data(
 ) -> dict[str, np.ndarray]:
     if isinstance(streams, StreamId):
         streams = (streams,)
-    data_arrays = {
-        str(stream_id): create_stream_array(dp, stream_id, stream_info=stream_info)
-        for stream_id in streams
-    }
-    indices = {str(stream_id): 0 for stream_id in streams}
-
-    for s_data in generate_sensor_data(dp, streams=streams):
-        s_id = s_data.stream_id()
-        s_type = s_data.sensor_data_type().name.lower()
-        if s_type == "image" or s_type == "audio":
-            _, s_data = getattr(s_data, f"{s_type}_data_and_record")()
-        else:
-            s_data = getattr(s_data, f"{s_type}_data")()
-
-        data_array = data_arrays[str(s_id)]
-        index = indices[str(s_id)]
-        # data_array[index] = [getattr(s_data, name) for name in data_array.dtype.names]
-        for name in data_array.dtype.names:
-            data_array[index][name] = getattr(s_data, name)
-        indices[str(s_id)] += 1
+    data_arrays = {}
+    get_sensor_data = dp.get_sensor_data_by_index
+    # Fill each stream's array in its own loop so that the record type only has to be
+    # looked up once per stream instead of once per record
+    for s_id in streams:
+        data_array = create_stream_array(dp, s_id, stream_info=stream_info)
+        data_arrays[str(s_id)] = data_array
+        # same as generate_sensor_data, skip the streams that don't have any data
+        if dp.get_first_time_ns(s_id, _DEVICE_TIME) == -1:
+            continue
+        get_data = _data_getter(dp, s_id)
+        get_fields = _fields_getter(data_array.dtype.names)
+        for i in range(len(data_array)):
+            # structured arrays need a tuple (not a list) to set a whole record at once
+            data_array[i] = get_fields(get_data(get_sensor_data(s_id, i)))
 
     return data_arrays